@@ -0,0 +1,750 @@
+"""
+ - Insurance Customer Management System
+Multi-session load test for streamlit_app.py
+
+Runs the app with streamlit.testing.v1.AppTest against an in-memory stand-in
+for the Snowflake session and simulates N claims agents using it at once.
+Each agent follows a script (browse, filter, search, open the editor, commit,
+add a note) and the harness reports reruns/sec, rerun latency percentiles,
+warehouse queries per rerun and peak RSS.
+
+All agent sessions stay alive for the whole test and share the process-wide
+caches, exactly like browser sessions in one app container. AppTest installs
+a process-global runtime for each script run, so reruns of different agents
+are interleaved round-robin rather than executed in parallel threads.
+
+Usage:
+    python load_test.py --users 30                  # compare with the baseline
+    python load_test.py --users 30 --save-baseline  # store a new baseline
+
+The command exits with status 1 when a metric regresses beyond its threshold.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import resource
+import sys
+import threading
+import time
+import types
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+APP_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'streamlit_app.py')
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'load_test_baseline.json')
+
+# Allowed regression (percent) before a metric fails the run.
+# Throughput must not drop, everything else must not grow.
+DEFAULT_THRESHOLDS = {
+    'reruns_per_sec': 20.0,
+    'p50_ms': 25.0,
+    'p95_ms': 30.0,
+    'p99_ms': 40.0,
+    'queries_per_rerun': 10.0,
+    'peak_rss_mb': 20.0
+}
+HIGHER_IS_BETTER = {'reruns_per_sec'}
+
+CUSTOMER_COLUMNS = [
+    'CUSTOMER_ID', 'FIRST_NAME', 'LAST_NAME', 'EMAIL', 'PHONE', 'POLICY_TYPE',
+    'POLICY_NUMBER', 'PREMIUM_AMOUNT', 'STATUS', 'START_DATE',
+    'LAST_MODIFIED_BY', 'LAST_MODIFIED_AT'
+]
+AUDIT_COLUMNS = [
+    'AUDIT_ID', 'CUSTOMER_ID', 'MODIFIED_BY', 'MODIFIED_AT', 'COMMENT',
+    'CHANGE_TYPE', 'OLD_VALUES', 'NEW_VALUES', 'CHANGE_SUMMARY'
+]
+NOTE_COLUMNS = ['NOTE_ID', 'TABLE_NAME', 'NOTE_TEXT', 'CREATED_BY', 'CREATED_AT']
+STREAM_COLUMNS = ['CUSTOMER_ID', 'FIRST_NAME', 'LAST_NAME', 'ACTION', 'IS_UPDATE', 'ROW_ID']
+
+FIRST_NAMES = ['Mario', 'Laura', 'Giuseppe', 'Anna', 'Franco', 'Giulia', 'Roberto', 'Chiara', 'Luca', 'Sara']
+LAST_NAMES = ['Rossi', 'Bianchi', 'Verdi', 'Russo', 'Ferrari', 'Romano', 'Esposito', 'Colombo', 'Ricci', 'Marino']
+POLICY_TYPES = ['Auto', 'Home', 'Life', 'Health']
+STATUSES = ['Active', 'Active', 'Active', 'Pending', 'Suspended', 'Cancelled']
+
+# ============================================
+# LOCAL SNOWFLAKE STAND-IN
+# ============================================
+
+class LocalSessionError(Exception):
+    """Raised for SQL the local stand-in does not understand"""
+
+class Row(tuple):
+    """Result row readable by position or by column name, like a Snowpark Row"""
+
+    def __new__(cls, columns, values):
+        row = super().__new__(cls, values)
+        row._columns = list(columns)
+        return row
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return tuple.__getitem__(self, self._columns.index(key.upper()))
+        return tuple.__getitem__(self, key)
+
+class LocalResult:
+    """Lazy result of LocalSession.sql()"""
+
+    def __init__(self, warehouse, query, limit=None):
+        self._warehouse = warehouse
+        self._query = query
+        self._limit = limit
+
+    def limit(self, n):
+        return LocalResult(self._warehouse, self._query, n)
+
+    def to_pandas(self):
+        df = self._warehouse.execute(self._query)
+        return df if self._limit is None else df.head(self._limit)
+
+    def collect(self):
+        df = self.to_pandas()
+        return [Row(df.columns, values) for values in df.itertuples(index=False, name=None)]
+
+class LocalSession:
+    """Stand-in for a Snowpark Session backed by a LocalWarehouse"""
+
+    def __init__(self, warehouse):
+        self.warehouse = warehouse
+
+    def sql(self, query):
+        return LocalResult(self.warehouse, query)
+
+def _split_top_level(text, separator=','):
+    """Split SQL text on separator, ignoring quoted strings and parentheses"""
+    parts, depth, quoted, current = [], 0, False, []
+    i = 0
+    while i < len(text):
+        char = text[i]
+        if quoted:
+            current.append(char)
+            if char == "'":
+                if i + 1 < len(text) and text[i + 1] == "'":
+                    current.append("'")
+                    i += 1
+                else:
+                    quoted = False
+        elif char == "'":
+            quoted = True
+            current.append(char)
+        elif char == '(':
+            depth += 1
+            current.append(char)
+        elif char == ')':
+            depth -= 1
+            current.append(char)
+        elif char == separator and depth == 0:
+            parts.append(''.join(current).strip())
+            current = []
+        else:
+            current.append(char)
+        i += 1
+    if ''.join(current).strip():
+        parts.append(''.join(current).strip())
+    return parts
+
+def _split_union_all(text):
+    """Split 'SELECT ... UNION ALL SELECT ...' into the selected expression lists"""
+    selects, current = [], ''
+    for i, part in enumerate(re.split(r"('(?:[^']|'')*')", text)):
+        if i % 2:
+            current += part
+            continue
+        pieces = re.split(r'\s+UNION ALL\s+SELECT\s+', part, flags=re.I)
+        current += pieces[0]
+        for piece in pieces[1:]:
+            selects.append(current)
+            current = piece
+    selects.append(current)
+    return selects
+
+def _literal(expression):
+    """Evaluate the SQL literals the app writes (strings, numbers, JSON, NULL)"""
+    expression = expression.strip()
+    match = re.fullmatch(r"(?:TO_VARIANT\()?PARSE_JSON\('(.*)'\)\)?", expression, re.S | re.I)
+    if match:
+        return json.loads(match.group(1).replace("''", "'"))
+    if expression.startswith("'") and expression.endswith("'"):
+        return expression[1:-1].replace("''", "'")
+    if expression.upper() == 'NULL':
+        return None
+    if expression.upper().startswith('CURRENT_TIMESTAMP'):
+        return datetime.now()
+    try:
+        return int(expression)
+    except ValueError:
+        return float(expression)
+
+class LocalWarehouse:
+    """In-memory tables answering the queries issued by streamlit_app.py.
+
+    Every query is counted and delayed by a fixed latency to model the
+    warehouse round trip.
+    """
+
+    def __init__(self, customers=500, latency_ms=5.0, seed=7, user='LOAD_TEST_USER', role='APP_ADMIN'):
+        self.latency = latency_ms / 1000.0
+        self.user = user
+        self.role = role
+        self.query_count = 0
+        self.background_query_count = 0
+        self.unhandled = []
+        rng = random.Random(seed)
+        start = datetime(2022, 1, 1)
+        rows = []
+        for customer_id in range(1, customers + 1):
+            first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+            policy_type = rng.choice(POLICY_TYPES)
+            rows.append({
+                'CUSTOMER_ID': customer_id,
+                'FIRST_NAME': first,
+                'LAST_NAME': last,
+                'EMAIL': f"{first.lower()}.{last.lower()}{customer_id}@email.it",
+                'PHONE': f"+39 3{rng.randint(10, 49)} {rng.randint(1000000, 9999999)}",
+                'POLICY_TYPE': policy_type,
+                'POLICY_NUMBER': f"POL-{policy_type.upper()}-{customer_id:05d}",
+                'PREMIUM_AMOUNT': round(rng.uniform(400, 3500), 2),
+                'STATUS': rng.choice(STATUSES),
+                'START_DATE': (start + timedelta(days=rng.randint(0, 900))).date(),
+                'LAST_MODIFIED_BY': 'SYSTEM',
+                'LAST_MODIFIED_AT': start
+            })
+        self.tables = {
+            'CUSTOMERS': pd.DataFrame(rows, columns=CUSTOMER_COLUMNS),
+            'CUSTOMER_AUDIT_LOG': pd.DataFrame(columns=AUDIT_COLUMNS),
+            'TABLE_NOTES': pd.DataFrame(columns=NOTE_COLUMNS),
+            'NOTE_READS': pd.DataFrame(columns=['USER_NAME', 'TABLE_NAME', 'LAST_READ_AT'])
+        }
+
+    def execute(self, query):
+        # Prefetch workers query outside of any rerun: count them apart
+        if threading.current_thread().name.startswith('prefetch'):
+            self.background_query_count += 1
+        else:
+            self.query_count += 1
+        if self.latency:
+            time.sleep(self.latency)
+        sql = ' '.join(query.split())
+        try:
+            result = self._run(sql)
+        except LocalSessionError:
+            raise
+        except Exception as e:
+            self.unhandled.append(sql)
+            raise LocalSessionError(f"{e} while running: {sql[:200]}")
+        if result is None:
+            self.unhandled.append(sql)
+            raise LocalSessionError(f"Unsupported query: {sql[:200]}")
+        return result
+
+    def _run(self, sql):
+        """Run one statement, or return None when it is not supported"""
+        upper = sql.upper()
+        if upper.startswith('SELECT CURRENT_USER()'):
+            return pd.DataFrame({'USER': [self.user], 'ROLE': [self.role]})
+        if 'FROM APP_DATA.SESSION_ENTITLEMENTS_VIEW' in upper:
+            # Native app: the role is taken to be the application role
+            return pd.DataFrame({
+                'USER_NAME': [self.user],
+                'ROLE_NAME': [self.role],
+                'IS_VIEWER': [True],
+                'IS_EDITOR': [self.role.upper() == 'APP_EDITOR'],
+                'IS_ADMIN': [self.role.upper() == 'APP_ADMIN']
+            })
+        if upper.startswith('SELECT CURRENT_TIMESTAMP()'):
+            return pd.DataFrame({'TS': [str(datetime.now())]})
+        if upper.startswith('EXECUTE IMMEDIATE'):
+            return self._execute_block(sql)
+        if upper.startswith('CALL '):
+            return pd.DataFrame({'RESULT': ['OK']})
+        if upper.startswith('UPDATE CUSTOMER_AUDIT_LOG'):
+            return self._update_audit_summaries(sql)
+        if upper.startswith('UPDATE CUSTOMERS'):
+            return self._update_customers(sql)
+        if upper.startswith('INSERT INTO'):
+            return self._insert(sql)
+        if upper.startswith('MERGE INTO NOTE_READS'):
+            return self._merge_note_reads(sql)
+        if upper.startswith('DELETE FROM CUSTOMERS'):
+            return self._delete_customers(upper)
+        if upper.startswith('SELECT'):
+            return self._select(sql, upper)
+        return None
+
+    def _execute_block(self, sql):
+        """EXECUTE IMMEDIATE $$ BEGIN BEGIN TRANSACTION; ...; COMMIT; ... $$: all statements or none"""
+        match = re.search(r'BEGIN TRANSACTION;(.*);\s*COMMIT;', sql, re.S | re.I)
+        if not match:
+            raise LocalSessionError(f"Unsupported block: {sql[:200]}")
+        snapshot = {name: table.copy() for name, table in self.tables.items()}
+        try:
+            for statement in _split_top_level(match.group(1), ';'):
+                statement = statement.strip()
+                if statement and self._run(statement) is None:
+                    raise LocalSessionError(f"Unsupported statement in block: {statement[:200]}")
+        except Exception:
+            self.tables = snapshot
+            raise
+        return pd.DataFrame({'anonymous block': [None]})
+
+    def _limit(self, df, upper):
+        match = re.search(r'\bLIMIT (\d+)(?: OFFSET (\d+))?', upper)
+        if not match:
+            return df
+        offset = int(match.group(2) or 0)
+        return df.iloc[offset:offset + int(match.group(1))]
+
+    def _select(self, sql, upper):
+        customers = self.tables['CUSTOMERS']
+        if 'FROM CUSTOMERS_STREAM' in upper:
+            return pd.DataFrame(columns=STREAM_COLUMNS)
+        if 'FROM CUSTOMER_AUDIT_LOG' in upper:
+            audit = self.tables['CUSTOMER_AUDIT_LOG']
+            df = audit.merge(customers[['CUSTOMER_ID', 'FIRST_NAME', 'LAST_NAME']], on='CUSTOMER_ID', how='left')
+            df['CUSTOMER_NAME'] = df['FIRST_NAME'] + ' ' + df['LAST_NAME']
+            df = df.drop(columns=['FIRST_NAME', 'LAST_NAME'])
+            if 'TOTAL_RECORDS' in upper:
+                df['TOTAL_RECORDS'] = len(audit)
+            if 'MISSING_SUMMARIES' in upper:
+                df['MISSING_SUMMARIES'] = int(audit['CHANGE_SUMMARY'].isna().sum())
+            if 'WHERE CHANGE_SUMMARY IS NULL' in upper:
+                df = df[df['CHANGE_SUMMARY'].isna()]
+            match = re.search(r'AUDIT_ID = (\d+)', upper)
+            if match:
+                df = df[df['AUDIT_ID'] == int(match.group(1))]
+            df = df.sort_values('AUDIT_ID', ascending=False)
+            return self._limit(df, upper).reset_index(drop=True)
+        if 'FROM TABLE_NOTES' in upper:
+            notes = self.tables['TABLE_NOTES'].sort_values(['CREATED_AT', 'NOTE_ID'], ascending=False)
+            if 'QUALIFY' in upper:
+                return self._notes_overview(sql, notes)
+            match = re.search(r"TABLE_NAME = '((?:[^']|'')*)'", sql)
+            if match:
+                notes = notes[notes['TABLE_NAME'] == match.group(1).replace("''", "'")]
+            return self._limit(notes, upper).reset_index(drop=True)
+        if 'FROM CUSTOMERS' in upper:
+            match = re.search(r'CUSTOMER_ID = (\d+)', upper)
+            if match:
+                return customers[customers['CUSTOMER_ID'] == int(match.group(1))].reset_index(drop=True)
+            match = re.search(r'CUSTOMER_ID IN \(([\d, ]+)\)', upper)
+            if match:
+                ids = [int(i) for i in match.group(1).split(',')]
+                return customers[customers['CUSTOMER_ID'].isin(ids)].reset_index(drop=True)
+            if upper.startswith('SELECT DISTINCT'):
+                return customers[['STATUS', 'POLICY_TYPE']].drop_duplicates().reset_index(drop=True)
+            return self._limit(customers, upper).reset_index(drop=True)
+        raise LocalSessionError(f"Unsupported query: {sql[:200]}")
+
+    def _notes_overview(self, sql, notes):
+        """Latest note and unread count per table for one user"""
+        user = re.search(r"USER_NAME = '((?:[^']|'')*)'", sql).group(1).replace("''", "'")
+        reads = self.tables['NOTE_READS']
+        reads = reads[reads['USER_NAME'] == user].set_index('TABLE_NAME')['LAST_READ_AT']
+        last_read = pd.to_datetime(notes['TABLE_NAME'].map(reads)).fillna(datetime(1970, 1, 1))
+        unread = notes[(notes['CREATED_AT'] > last_read) & (notes['CREATED_BY'] != user)]
+        latest = notes.drop_duplicates('TABLE_NAME').copy()
+        latest['UNREAD_COUNT'] = latest['TABLE_NAME'].map(unread['TABLE_NAME'].value_counts()).fillna(0).astype(int)
+        return latest.reset_index(drop=True)
+
+    def _merge_note_reads(self, sql):
+        match = re.search(r"SELECT '((?:[^']|'')*)' as USER_NAME, '((?:[^']|'')*)' as TABLE_NAME", sql, re.I)
+        user, table = (group.replace("''", "'") for group in match.groups())
+        reads = self.tables['NOTE_READS']
+        reads = reads[~((reads['USER_NAME'] == user) & (reads['TABLE_NAME'] == table))]
+        new_row = pd.DataFrame([{'USER_NAME': user, 'TABLE_NAME': table, 'LAST_READ_AT': datetime.now()}])
+        self.tables['NOTE_READS'] = new_row if reads.empty else pd.concat([reads, new_row], ignore_index=True)
+        return pd.DataFrame({'number of rows updated': [1]})
+
+    def _update_customers(self, sql):
+        match = re.search(r'SET (.*) WHERE CUSTOMER_ID = (\d+)', sql, re.S | re.I)
+        if not match:
+            raise LocalSessionError(f"Unsupported update: {sql[:200]}")
+        customers = self.tables['CUSTOMERS']
+        mask = customers['CUSTOMER_ID'] == int(match.group(2))
+        for assignment in _split_top_level(match.group(1)):
+            column, expression = assignment.split('=', 1)
+            customers.loc[mask, column.strip().upper()] = _literal(expression)
+        return pd.DataFrame({'number of rows updated': [int(mask.sum())]})
+
+    def _update_audit_summaries(self, sql):
+        """UPDATE CUSTOMER_AUDIT_LOG ... FROM VALUES written by the summary backfill"""
+        match = re.search(r'FROM VALUES (.*)\) v WHERE', sql, re.S | re.I)
+        if not match:
+            raise LocalSessionError(f"Unsupported update: {sql[:200]}")
+        audit = self.tables['CUSTOMER_AUDIT_LOG']
+        updated = 0
+        for audit_id, summary in re.findall(r"\((\d+), '((?:[^']|'')*)'\)", match.group(1)):
+            mask = audit['AUDIT_ID'] == int(audit_id)
+            audit.loc[mask, 'CHANGE_SUMMARY'] = summary.replace("''", "'")
+            updated += int(mask.sum())
+        return pd.DataFrame({'number of rows updated': [updated]})
+
+    def _insert(self, sql):
+        match = re.match(r'INSERT INTO (\w+) \((.*?)\) (VALUES \((.*)\)|SELECT (.*))$', sql, re.S | re.I)
+        if not match:
+            raise LocalSessionError(f"Unsupported insert: {sql[:200]}")
+        table = match.group(1).upper()
+        columns = [c.strip().upper() for c in match.group(2).split(',')]
+        selects = [match.group(4)] if match.group(4) else _split_union_all(match.group(5))
+        # INSERT ... SELECT ..., OBJECT_CONSTRUCT_KEEP_NULL(*) FROM CUSTOMERS WHERE CUSTOMER_ID = n
+        source = None
+        if not match.group(4):
+            source_match = re.fullmatch(r'(.*) FROM CUSTOMERS WHERE CUSTOMER_ID = (\d+)', selects[-1], re.S | re.I)
+            if source_match:
+                selects[-1] = source_match.group(1)
+                customers = self.tables['CUSTOMERS']
+                record = customers[customers['CUSTOMER_ID'] == int(source_match.group(2))]
+                source = json.loads(json.dumps(record.iloc[0].to_dict(), default=str))
+        df = self.tables[table]
+        key = {'CUSTOMER_AUDIT_LOG': 'AUDIT_ID', 'TABLE_NOTES': 'NOTE_ID'}.get(table)
+        rows = []
+        for expressions in selects:
+            row = dict(zip(columns, [
+                source if v.strip().upper() == 'OBJECT_CONSTRUCT_KEEP_NULL(*)' else _literal(v)
+                for v in _split_top_level(expressions)
+            ]))
+            if key:
+                row[key] = len(df) + len(rows) + 1
+            if table == 'TABLE_NOTES':
+                row.setdefault('CREATED_AT', datetime.now())
+            rows.append(row)
+        new_rows = pd.DataFrame(rows, columns=df.columns)
+        self.tables[table] = new_rows if df.empty else pd.concat([df, new_rows], ignore_index=True)
+        return pd.DataFrame({'number of rows inserted': [len(rows)]})
+
+    def _delete_customers(self, upper):
+        match = re.search(r'CUSTOMER_ID IN \(([\d, ]+)\)', upper)
+        if not match:
+            raise LocalSessionError(f"Unsupported delete: {upper[:200]}")
+        customers = self.tables['CUSTOMERS']
+        mask = customers['CUSTOMER_ID'].isin([int(i) for i in match.group(1).split(',')])
+        self.tables['CUSTOMERS'] = customers[~mask].reset_index(drop=True)
+        return pd.DataFrame({'number of rows deleted': [int(mask.sum())]})
+
+def install_local_session(warehouse):
+    """Make snowflake.snowpark.context.get_active_session return a LocalSession"""
+    local_session = LocalSession(warehouse)
+    snowflake = types.ModuleType('snowflake')
+    snowpark = types.ModuleType('snowflake.snowpark')
+    context = types.ModuleType('snowflake.snowpark.context')
+    functions = types.ModuleType('snowflake.snowpark.functions')
+    context.get_active_session = lambda: local_session
+    functions.col = lambda name: name
+    snowflake.snowpark = snowpark
+    snowpark.context = context
+    snowpark.functions = functions
+    sys.modules.update({
+        'snowflake': snowflake,
+        'snowflake.snowpark': snowpark,
+        'snowflake.snowpark.context': context,
+        'snowflake.snowpark.functions': functions
+    })
+
+# ============================================
+# SCRIPTED AGENTS
+# ============================================
+
+def _by_label(widgets, label):
+    for widget in widgets:
+        if widget.label == label:
+            return widget
+    raise LookupError(f"Widget not found: {label}")
+
+def _first_customer_id(at):
+    for button in at.button:
+        if button.key and button.key.startswith('edit_btn_'):
+            return int(button.key[len('edit_btn_'):])
+    return None
+
+# follow_rerun() and MeasuredAppTest rely on AppTest internals that are not
+# public API (AppTest._run, AppTest._tree, element_tree.get_widget_state)
+VERIFIED_STREAMLIT_VERSIONS = ('1.39',)
+
+def check_apptest_internals(at):
+    """Fail with a clear message when this Streamlit lacks the AppTest internals we use"""
+    import streamlit
+
+    version = streamlit.__version__
+    verified = ', '.join(VERIFIED_STREAMLIT_VERSIONS)
+    problem = None
+    try:
+        from streamlit.proto.WidgetStates_pb2 import WidgetStates  # noqa: F401
+        from streamlit.testing.v1.element_tree import get_widget_state  # noqa: F401
+    except ImportError as e:
+        problem = str(e)
+    else:
+        missing = [name for name in ('_run', '_tree') if not hasattr(at, name)]
+        if missing:
+            problem = f"AppTest has no {', '.join(missing)}"
+    if problem:
+        raise RuntimeError(
+            f"The load test needs AppTest internals missing in Streamlit {version} ({problem}). "
+            f"It was verified on Streamlit {verified}: pip install 'streamlit=={VERIFIED_STREAMLIT_VERSIONS[-1]}.*'"
+        )
+    if not version.startswith(tuple(v + '.' for v in VERIFIED_STREAMLIT_VERSIONS)):
+        print(f"Warning: load test verified on Streamlit {verified}, running on {version}", file=sys.stderr)
+
+def follow_rerun(at):
+    """Render the page again after the app called st.rerun().
+
+    AppTest stops at st.rerun() and keeps the widgets of the interrupted run
+    in its element tree: their state can no longer be read, so only the
+    widgets that still exist send their values, like a browser would.
+    """
+    from streamlit.proto.WidgetStates_pb2 import WidgetStates
+    from streamlit.testing.v1.element_tree import get_widget_state
+
+    widget_states = WidgetStates()
+    for node in at._tree:
+        try:
+            state = get_widget_state(node)
+        except Exception:
+            continue
+        if state is not None:
+            widget_states.widgets.append(state)
+    at._run(widget_states)
+
+def agent_script(agent_id):
+    """Return the ordered actions of one simulated claims agent"""
+    rng = random.Random(agent_id)
+    status = rng.choice(['Active', 'Pending', 'Suspended'])
+    search = rng.choice(LAST_NAMES).lower()
+    state = {}
+
+    def browse(at):
+        at.run()
+
+    def filter_status(at):
+        _by_label(at.selectbox, 'Status').set_value(status).run()
+
+    def search_customers(at):
+        _by_label(at.selectbox, 'Status').set_value('All')
+        _by_label(at.text_input, 'Search (Name, Email, Policy Number)').input(search).run()
+
+    def open_editor(at):
+        state['customer_id'] = _first_customer_id(at)
+        if state['customer_id'] is None:
+            _by_label(at.text_input, 'Search (Name, Email, Policy Number)').input('').run()
+            state['customer_id'] = _first_customer_id(at)
+        at.button(key=f"edit_btn_{state['customer_id']}").click().run()
+
+    def commit(at):
+        customer_id = state['customer_id']
+        at.text_input(key=f"phone_{customer_id}").input(f"+39 347 {agent_id:07d}")
+        at.text_area(key=f"comment_{customer_id}").input(f"Load test update by agent {agent_id}")
+        at.button(key=f"commit_{customer_id}").click().run()
+        # The app calls st.rerun() after a commit: render the fresh page
+        follow_rerun(at)
+
+    def add_note(at):
+        at.button(key='notes_button').click().run()
+        at.text_area(key='note_input').input(f"Nota di prova dell'agente {agent_id}")
+        at.button(key='save_note').click().run()
+        follow_rerun(at)
+
+    return [
+        ('browse', browse),
+        ('filter', filter_status),
+        ('search', search_customers),
+        ('open_editor', open_editor),
+        ('commit', commit),
+        ('add_note', add_note)
+    ]
+
+# ============================================
+# MEASUREMENT
+# ============================================
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+class MeasuredAppTest:
+    """Wrap an AppTest so every script run is timed and its queries counted"""
+
+    def __init__(self, at, warehouse, samples):
+        self._at = at
+        self._warehouse = warehouse
+        self._samples = samples
+        original_run = at._run
+
+        def measured_run(*args, **kwargs):
+            queries_before = warehouse.query_count
+            started = time.perf_counter()
+            result = original_run(*args, **kwargs)
+            samples.append((
+                (time.perf_counter() - started) * 1000.0,
+                warehouse.query_count - queries_before
+            ))
+            return result
+
+        at._run = measured_run
+
+    def __getattr__(self, name):
+        return getattr(self._at, name)
+
+def run_load_test(users=30, iterations=1, customers=500, latency_ms=5.0, timeout=30.0):
+    """Simulate concurrent agents and return the measured metrics"""
+    warehouse = LocalWarehouse(customers=customers, latency_ms=latency_ms)
+    install_local_session(warehouse)
+
+    from streamlit.testing.v1 import AppTest
+
+    samples = []
+    errors = []
+    agents = []
+    for agent_id in range(users):
+        at = AppTest.from_file(APP_FILE, default_timeout=timeout)
+        # Guardrail breaches raise, so they show up as script errors
+        at.secrets['query_guard'] = {'strict': True}
+        if not agents:
+            check_apptest_internals(at)
+        agents.append((agent_id, MeasuredAppTest(at, warehouse, samples)))
+
+    started = time.perf_counter()
+    for _ in range(iterations):
+        scripts = [(agent_id, at, agent_script(agent_id)) for agent_id, at in agents]
+        for step in range(max(len(script) for _, _, script in scripts)):
+            for agent_id, at, script in scripts:
+                if step >= len(script):
+                    continue
+                action, perform = script[step]
+                try:
+                    perform(at)
+                    for exception in at.exception:
+                        errors.append(f"agent {agent_id} {action}: {exception.message}")
+                except Exception as e:
+                    errors.append(f"agent {agent_id} {action}: {e}")
+    elapsed = time.perf_counter() - started
+
+    latencies = [latency for latency, _ in samples]
+    queries = [count for _, count in samples]
+    return {
+        'users': users,
+        'iterations': iterations,
+        'customers': customers,
+        'query_latency_ms': latency_ms,
+        'reruns': len(samples),
+        'reruns_per_sec': round(len(samples) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(_percentile(latencies, 50), 1),
+        'p95_ms': round(_percentile(latencies, 95), 1),
+        'p99_ms': round(_percentile(latencies, 99), 1),
+        'queries_per_rerun': round(sum(queries) / len(queries), 2) if queries else 0.0,
+        'max_queries_per_rerun': max(queries) if queries else 0,
+        'background_queries': warehouse.background_query_count,
+        'peak_rss_mb': round(_peak_rss_mb(), 1),
+        'errors': errors,
+        'unhandled_queries': sorted(set(warehouse.unhandled))
+    }
+
+def compare_with_baseline(metrics, baseline, thresholds):
+    """Return the list of metrics that regressed beyond their threshold"""
+    regressions = []
+    for metric, allowed_pct in thresholds.items():
+        if metric not in baseline or not baseline[metric]:
+            continue
+        base, current = float(baseline[metric]), float(metrics[metric])
+        change_pct = (current - base) / base * 100.0
+        worse = -change_pct if metric in HIGHER_IS_BETTER else change_pct
+        if worse > allowed_pct:
+            regressions.append(
+                f"{metric}: {base:g} -> {current:g} ({change_pct:+.1f}%, allowed {allowed_pct:g}%)"
+            )
+    return regressions
+
+def _print_report(metrics):
+    print("Load test results")
+    print("=================")
+    for key in ['users', 'iterations', 'customers', 'query_latency_ms', 'reruns',
+                'reruns_per_sec', 'p50_ms', 'p95_ms', 'p99_ms',
+                'queries_per_rerun', 'max_queries_per_rerun', 'background_queries', 'peak_rss_mb']:
+        print(f"  {key:<24}{metrics[key]}")
+    if metrics['errors']:
+        print(f"\n{len(metrics['errors'])} script error(s):")
+        for error in metrics['errors'][:20]:
+            print(f"  - {error}")
+    if metrics['unhandled_queries']:
+        print("\nQueries not understood by the local stand-in:")
+        for query in metrics['unhandled_queries']:
+            print(f"  - {query[:160]}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-session load test for streamlit_app.py")
+    parser.add_argument('--users', type=int, default=30, help="Number of simulated agents")
+    parser.add_argument('--iterations', type=int, default=1, help="Times each agent repeats its script")
+    parser.add_argument('--customers', type=int, default=500, help="Rows in the stand-in CUSTOMERS table")
+    parser.add_argument('--query-latency-ms', type=float, default=5.0, help="Simulated warehouse round trip")
+    parser.add_argument('--timeout', type=float, default=30.0, help="Timeout for a single script run (s)")
+    parser.add_argument('--baseline', default=BASELINE_FILE, help="Baseline JSON file")
+    parser.add_argument('--save-baseline', action='store_true', help="Store these results as the new baseline")
+    parser.add_argument('--threshold', action='append', default=[], metavar='METRIC=PCT',
+                        help="Override an allowed regression, e.g. p95_ms=50")
+    parser.add_argument('--output', help="Also write the results to this JSON file")
+    args = parser.parse_args(argv)
+
+    thresholds = dict(DEFAULT_THRESHOLDS)
+    for override in args.threshold:
+        metric, _, pct = override.partition('=')
+        if metric not in thresholds:
+            parser.error(f"Unknown metric: {metric}")
+        thresholds[metric] = float(pct)
+
+    metrics = run_load_test(
+        users=args.users,
+        iterations=args.iterations,
+        customers=args.customers,
+        latency_ms=args.query_latency_ms,
+        timeout=args.timeout
+    )
+    _print_report(metrics)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(metrics, f, indent=2)
+
+    if metrics['errors'] or metrics['unhandled_queries']:
+        print("\n✗ The scripted agents hit errors")
+        return 1
+
+    if args.save_baseline:
+        baseline = {key: value for key, value in metrics.items() if key not in ('errors', 'unhandled_queries')}
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2)
+            f.write('\n')
+        print(f"\n✓ Baseline saved to {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\n⚠ No baseline at {args.baseline}: run with --save-baseline first")
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    for key in ('users', 'iterations', 'customers', 'query_latency_ms'):
+        if baseline.get(key) != metrics[key]:
+            print(f"\n⚠ Baseline was recorded with {key}={baseline.get(key)}, this run used {metrics[key]}")
+
+    regressions = compare_with_baseline(metrics, baseline, thresholds)
+    if regressions:
+        print("\n✗ Regressions compared with the baseline:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        return 1
+
+    print("\n✓ No regressions compared with the baseline")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
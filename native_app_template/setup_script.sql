@@ -42,7 +42,8 @@ SELECT
     COMMENT,
     CHANGE_TYPE,
     OLD_VALUES,
-    NEW_VALUES
+    NEW_VALUES,
+    CHANGE_SUMMARY
 FROM CUSTOMER_AUDIT_LOG;
 
 -- Table notes view
@@ -66,6 +67,172 @@ SELECT
     METADATA$ROW_ID as ROW_ID
 FROM CUSTOMERS_STREAM;
 
+-- ============================================
+-- Paged Data Access
+-- ============================================
+-- Secure views stop the optimizer from pushing the caller's predicates
+-- into the view, so SELECT * over customers_view always scans the whole
+-- table. These secure functions take the filters and the page as
+-- arguments and apply them inside, before the secure boundary.
+-- NULL filters mean "no filter"; callers ORDER BY the key column.
+
+-- One page of customers, with the total number of matching rows
+CREATE OR REPLACE SECURE FUNCTION app_data.customers_page(
+    status_filter STRING,
+    policy_type_filter STRING,
+    search_text STRING,
+    page_size NUMBER,
+    page_number NUMBER
+)
+RETURNS TABLE (
+    CUSTOMER_ID NUMBER,
+    FIRST_NAME VARCHAR,
+    LAST_NAME VARCHAR,
+    EMAIL VARCHAR,
+    PHONE VARCHAR,
+    POLICY_TYPE VARCHAR,
+    POLICY_NUMBER VARCHAR,
+    PREMIUM_AMOUNT NUMBER(10,2),
+    STATUS VARCHAR,
+    START_DATE DATE,
+    LAST_MODIFIED_BY VARCHAR,
+    LAST_MODIFIED_AT TIMESTAMP_NTZ,
+    TOTAL_RECORDS NUMBER
+)
+AS
+$$
+    SELECT 
+        CUSTOMER_ID,
+        FIRST_NAME,
+        LAST_NAME,
+        EMAIL,
+        PHONE,
+        POLICY_TYPE,
+        POLICY_NUMBER,
+        PREMIUM_AMOUNT,
+        STATUS,
+        START_DATE,
+        LAST_MODIFIED_BY,
+        LAST_MODIFIED_AT,
+        COUNT(*) OVER () as TOTAL_RECORDS
+    FROM CUSTOMERS
+    WHERE (status_filter IS NULL OR STATUS = status_filter)
+      AND (policy_type_filter IS NULL OR POLICY_TYPE = policy_type_filter)
+      AND (search_text IS NULL
+           OR CONTAINS(LOWER(FIRST_NAME), LOWER(search_text))
+           OR CONTAINS(LOWER(LAST_NAME), LOWER(search_text))
+           OR CONTAINS(LOWER(EMAIL), LOWER(search_text))
+           OR CONTAINS(LOWER(POLICY_NUMBER), LOWER(search_text)))
+    QUALIFY ROW_NUMBER() OVER (ORDER BY CUSTOMER_ID)
+        BETWEEN page_number * page_size + 1 AND (page_number + 1) * page_size
+$$;
+
+-- One page of the audit log, newest first, optionally for one customer
+CREATE OR REPLACE SECURE FUNCTION app_data.audit_log_page(
+    customer_filter NUMBER,
+    page_size NUMBER,
+    page_number NUMBER
+)
+RETURNS TABLE (
+    AUDIT_ID NUMBER,
+    CUSTOMER_ID NUMBER,
+    CUSTOMER_NAME VARCHAR,
+    MODIFIED_BY VARCHAR,
+    MODIFIED_AT TIMESTAMP_NTZ,
+    COMMENT VARCHAR,
+    CHANGE_TYPE VARCHAR,
+    CHANGE_SUMMARY VARCHAR,
+    TOTAL_RECORDS NUMBER
+)
+AS
+$$
+    SELECT 
+        a.AUDIT_ID,
+        a.CUSTOMER_ID,
+        c.FIRST_NAME || ' ' || c.LAST_NAME as CUSTOMER_NAME,
+        a.MODIFIED_BY,
+        a.MODIFIED_AT,
+        a.COMMENT,
+        a.CHANGE_TYPE,
+        a.CHANGE_SUMMARY,
+        COUNT(*) OVER () as TOTAL_RECORDS
+    FROM CUSTOMER_AUDIT_LOG a
+    LEFT JOIN CUSTOMERS c ON a.CUSTOMER_ID = c.CUSTOMER_ID
+    WHERE customer_filter IS NULL OR a.CUSTOMER_ID = customer_filter
+    QUALIFY ROW_NUMBER() OVER (ORDER BY a.AUDIT_ID DESC)
+        BETWEEN page_number * page_size + 1 AND (page_number + 1) * page_size
+$$;
+
+-- One page of a table's notes, newest first
+CREATE OR REPLACE SECURE FUNCTION app_data.table_notes_page(
+    table_filter STRING,
+    page_size NUMBER,
+    page_number NUMBER
+)
+RETURNS TABLE (
+    NOTE_ID NUMBER,
+    TABLE_NAME VARCHAR,
+    NOTE_TEXT VARCHAR,
+    CREATED_BY VARCHAR,
+    CREATED_AT TIMESTAMP_NTZ
+)
+AS
+$$
+    SELECT 
+        NOTE_ID,
+        TABLE_NAME,
+        NOTE_TEXT,
+        CREATED_BY,
+        CREATED_AT
+    FROM TABLE_NOTES
+    WHERE TABLE_NAME = table_filter
+    QUALIFY ROW_NUMBER() OVER (ORDER BY CREATED_AT DESC, NOTE_ID DESC)
+        BETWEEN page_number * page_size + 1 AND (page_number + 1) * page_size
+$$;
+
+-- ============================================
+-- KPI Views
+-- ============================================
+-- Aggregated in the warehouse, so dashboards read a handful of rows
+-- instead of pulling every customer or audit record.
+
+-- Customers and premiums by status and policy type
+CREATE OR REPLACE SECURE VIEW app_data.customer_kpis_view AS
+SELECT 
+    STATUS,
+    POLICY_TYPE,
+    COUNT(*) as CUSTOMER_COUNT,
+    SUM(PREMIUM_AMOUNT) as TOTAL_PREMIUM,
+    AVG(PREMIUM_AMOUNT) as AVG_PREMIUM,
+    MAX(LAST_MODIFIED_AT) as LAST_MODIFIED_AT
+FROM CUSTOMERS
+GROUP BY STATUS, POLICY_TYPE;
+
+-- Daily audit activity by change type over the last 90 days
+CREATE OR REPLACE SECURE VIEW app_data.audit_activity_view AS
+SELECT 
+    DATE_TRUNC('DAY', MODIFIED_AT)::DATE as ACTIVITY_DATE,
+    CHANGE_TYPE,
+    COUNT(*) as CHANGE_COUNT,
+    COUNT(DISTINCT CUSTOMER_ID) as CUSTOMERS_CHANGED,
+    COUNT(DISTINCT MODIFIED_BY) as USERS_ACTIVE
+FROM CUSTOMER_AUDIT_LOG
+WHERE MODIFIED_AT >= DATEADD('DAY', -90, CURRENT_DATE())
+GROUP BY ACTIVITY_DATE, CHANGE_TYPE;
+
+-- ============================================
+-- Session Entitlements
+-- ============================================
+-- One row with the caller's application roles. The Streamlit app reads
+-- it once per browser session and keeps the result in session state.
+CREATE OR REPLACE SECURE VIEW app_data.session_entitlements_view AS
+SELECT 
+    CURRENT_USER() as USER_NAME,
+    CURRENT_ROLE() as ROLE_NAME,
+    IS_APPLICATION_ROLE_IN_SESSION('APP_VIEWER') as IS_VIEWER,
+    IS_APPLICATION_ROLE_IN_SESSION('APP_EDITOR') as IS_EDITOR,
+    IS_APPLICATION_ROLE_IN_SESSION('APP_ADMIN') as IS_ADMIN;
+
 -- ============================================
 -- Grant Privileges to Roles
 -- ============================================
@@ -76,6 +243,12 @@ GRANT SELECT ON VIEW app_data.customers_view TO APPLICATION ROLE app_viewer;
 GRANT SELECT ON VIEW app_data.audit_log_view TO APPLICATION ROLE app_viewer;
 GRANT SELECT ON VIEW app_data.table_notes_view TO APPLICATION ROLE app_viewer;
 GRANT SELECT ON VIEW app_data.customers_stream_view TO APPLICATION ROLE app_viewer;
+GRANT SELECT ON VIEW app_data.customer_kpis_view TO APPLICATION ROLE app_viewer;
+GRANT SELECT ON VIEW app_data.audit_activity_view TO APPLICATION ROLE app_viewer;
+GRANT SELECT ON VIEW app_data.session_entitlements_view TO APPLICATION ROLE app_viewer;
+GRANT USAGE ON FUNCTION app_data.customers_page(STRING, STRING, STRING, NUMBER, NUMBER) TO APPLICATION ROLE app_viewer;
+GRANT USAGE ON FUNCTION app_data.audit_log_page(NUMBER, NUMBER, NUMBER) TO APPLICATION ROLE app_viewer;
+GRANT USAGE ON FUNCTION app_data.table_notes_page(STRING, NUMBER, NUMBER) TO APPLICATION ROLE app_viewer;
 
 -- Editor role (can edit customers and add notes)
 GRANT USAGE ON SCHEMA app_data TO APPLICATION ROLE app_editor;
@@ -83,6 +256,12 @@ GRANT SELECT ON VIEW app_data.customers_view TO APPLICATION ROLE app_editor;
 GRANT SELECT, INSERT ON VIEW app_data.audit_log_view TO APPLICATION ROLE app_editor;
 GRANT SELECT, INSERT ON VIEW app_data.table_notes_view TO APPLICATION ROLE app_editor;
 GRANT SELECT ON VIEW app_data.customers_stream_view TO APPLICATION ROLE app_editor;
+GRANT SELECT ON VIEW app_data.customer_kpis_view TO APPLICATION ROLE app_editor;
+GRANT SELECT ON VIEW app_data.audit_activity_view TO APPLICATION ROLE app_editor;
+GRANT SELECT ON VIEW app_data.session_entitlements_view TO APPLICATION ROLE app_editor;
+GRANT USAGE ON FUNCTION app_data.customers_page(STRING, STRING, STRING, NUMBER, NUMBER) TO APPLICATION ROLE app_editor;
+GRANT USAGE ON FUNCTION app_data.audit_log_page(NUMBER, NUMBER, NUMBER) TO APPLICATION ROLE app_editor;
+GRANT USAGE ON FUNCTION app_data.table_notes_page(STRING, NUMBER, NUMBER) TO APPLICATION ROLE app_editor;
 
 -- Admin role (full access)
 GRANT USAGE ON SCHEMA app_data TO APPLICATION ROLE app_admin;
@@ -91,6 +270,12 @@ GRANT SELECT, INSERT, UPDATE, DELETE ON VIEW app_data.customers_view TO APPLICAT
 GRANT SELECT, INSERT ON VIEW app_data.audit_log_view TO APPLICATION ROLE app_admin;
 GRANT SELECT, INSERT ON VIEW app_data.table_notes_view TO APPLICATION ROLE app_admin;
 GRANT SELECT ON VIEW app_data.customers_stream_view TO APPLICATION ROLE app_admin;
+GRANT SELECT ON VIEW app_data.customer_kpis_view TO APPLICATION ROLE app_admin;
+GRANT SELECT ON VIEW app_data.audit_activity_view TO APPLICATION ROLE app_admin;
+GRANT SELECT ON VIEW app_data.session_entitlements_view TO APPLICATION ROLE app_admin;
+GRANT USAGE ON FUNCTION app_data.customers_page(STRING, STRING, STRING, NUMBER, NUMBER) TO APPLICATION ROLE app_admin;
+GRANT USAGE ON FUNCTION app_data.audit_log_page(NUMBER, NUMBER, NUMBER) TO APPLICATION ROLE app_admin;
+GRANT USAGE ON FUNCTION app_data.table_notes_page(STRING, NUMBER, NUMBER) TO APPLICATION ROLE app_admin;
 
 -- ============================================
 -- Create procedures for data operations
@@ -127,6 +312,9 @@ LANGUAGE SQL
 AS
 $$
 BEGIN
+    IF (NOT (IS_APPLICATION_ROLE_IN_SESSION('APP_EDITOR') OR IS_APPLICATION_ROLE_IN_SESSION('APP_ADMIN'))) THEN
+        RETURN 'Not authorized: app_editor or app_admin role required';
+    END IF;
     INSERT INTO TABLE_NOTES (TABLE_NAME, NOTE_TEXT, CREATED_BY)
     VALUES (:table_name, :note_text, :user);
     RETURN 'Note saved successfully';
@@ -34,7 +34,8 @@ CREATE OR REPLACE TABLE CUSTOMER_AUDIT_LOG (
     COMMENT TEXT,
     CHANGE_TYPE VARCHAR(20), -- 'UPDATE', 'INSERT', 'DELETE'
     OLD_VALUES VARIANT,
-    NEW_VALUES VARIANT
+    NEW_VALUES VARIANT,
+    CHANGE_SUMMARY VARCHAR(1000) -- e.g. 'STATUS: Active → Suspended', computed by the app at write time
 );
 
 -- Create a stream on the customers table to track changes
@@ -75,8 +76,26 @@ CREATE TABLE IF NOT EXISTS TABLE_NOTES (
     CREATED_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
 );
 
+-- Le note vengono lette per tabella e in ordine di data
+ALTER TABLE TABLE_NOTES CLUSTER BY (TABLE_NAME, CREATED_AT);
+
+-- Ultima lettura delle note di ogni tabella per utente (conteggio note non lette)
+CREATE TABLE IF NOT EXISTS NOTE_READS (
+    USER_NAME VARCHAR(100),
+    TABLE_NAME VARCHAR(100),
+    LAST_READ_AT TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+    PRIMARY KEY (USER_NAME, TABLE_NAME)
+);
+
 -- Verifica
 SELECT * FROM TABLE_NOTES ORDER BY CREATED_AT DESC LIMIT 5;
 
+-- ============================================
+-- Riepilogo modifiche nel log di audit
+-- ============================================
 
+-- Per installazioni esistenti: aggiunge la colonna CHANGE_SUMMARY.
+-- I record già presenti restano NULL e vengono completati a blocchi
+-- dal pulsante "Genera riepiloghi" nella vista CUSTOMER_AUDIT_LOG.
+ALTER TABLE CUSTOMER_AUDIT_LOG ADD COLUMN IF NOT EXISTS CHANGE_SUMMARY VARCHAR(1000);
 
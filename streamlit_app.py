@@ -5,15 +5,174 @@ Streamlit Application for Snowflake
 
 import streamlit as st
 import pandas as pd
+import numpy as np
 from snowflake.snowpark.context import get_active_session
 from snowflake.snowpark.functions import col
 import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+import uuid
+import zlib
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, ThreadPoolExecutor
 from datetime import datetime
 
+logger = logging.getLogger(__name__)
+
+# Page configuration with branding
+st.set_page_config(
+    page_title="Insurance - Customer Management",
+    page_icon="🔷",  # Using a blue diamond as placeholder
+    layout="wide",
+    initial_sidebar_state="expanded"
+)
+
+def _secrets_section(name, defaults):
+    """Settings of one st.secrets section, falling back to defaults for missing keys"""
+    settings = dict(defaults)
+    try:
+        settings.update(st.secrets.get(name, {}))
+    except Exception:
+        # No secrets configured
+        pass
+    return settings
+
+# ============================================
+# QUERY GUARDRAILS
+# ============================================
+
+# [query_guard] section of st.secrets
+QUERY_GUARD_DEFAULTS = {
+    'max_queries_per_rerun': 10,    # warehouse queries allowed in one rerun
+    'max_query_ms': 2000,           # latency budget of a single query
+    'max_rows': 5000,               # row cap for SELECTs without LIMIT
+    'strict': False                 # raise QueryGuardError on breaches (test mode)
+}
+# Snowflake roles that see the guardrail breaches in the sidebar
+ADMIN_ROLES = {'ACCOUNTADMIN', 'SYSADMIN', 'APP_ADMIN'}
+# Breaches kept in memory for the admin panel
+QUERY_GUARD_MAX_BREACHES = 200
+
+class QueryGuardError(Exception):
+    """A query was refused or broke a guardrail in strict mode"""
+
+@st.cache_resource
+def get_guard_breaches():
+    """Recent guardrail breaches of every session of this app process"""
+    return deque(maxlen=QUERY_GUARD_MAX_BREACHES)
+
+def _is_select(query):
+    return re.match(r'\s*(SELECT|WITH)\b', query, re.I) is not None
+
+def _reads_table(query):
+    return re.search(r'\bFROM\b', query, re.I) is not None
+
+def _has_limit(query):
+    return re.search(r'\bLIMIT\s+\d+', query, re.I) is not None
+
+def _has_filter(query):
+    return re.search(r'\b(WHERE|QUALIFY)\b', query, re.I) is not None
+
+class GuardedQuery:
+    """Result of QueryGuard.sql(): checks the guardrails when it is executed"""
+
+    def __init__(self, guard, query, allow_full_scan):
+        self._guard = guard
+        self._query = query
+        self._allow_full_scan = allow_full_scan
+
+    def _run(self, fetch):
+        guard, query = self._guard, self._query
+        guard.before_query(query, self._allow_full_scan)
+        
+        dataframe = guard.session.sql(query)
+        # Unbounded SELECTs fetch one row more than the cap to detect a breach
+        capped = _is_select(query) and _reads_table(query) and not _has_limit(query) and not self._allow_full_scan
+        if capped:
+            dataframe = dataframe.limit(guard.max_rows + 1)
+        
+        started = time.perf_counter()
+        result = fetch(dataframe)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        if capped and len(result) > guard.max_rows:
+            result = result[:guard.max_rows]
+            guard.breach('row_cap', f"more than {guard.max_rows} rows, result truncated", query)
+        if elapsed_ms > guard.max_query_ms:
+            # A write has already been applied: raising now would skip the
+            # statements that complete it (e.g. the audit row of an UPDATE)
+            guard.breach('latency', f"{elapsed_ms:.0f} ms (budget {guard.max_query_ms} ms)", query,
+                         can_raise=_is_select(query))
+        return result
+
+    def collect(self):
+        return self._run(lambda dataframe: dataframe.collect())
+
+    def to_pandas(self):
+        return self._run(lambda dataframe: dataframe.to_pandas())
+
+class QueryGuard:
+    """Wraps the Snowpark session to enforce a per-rerun query budget.
+
+    A new guard is created on every rerun, so its counter is the number of
+    queries of that rerun. Queries issued by other threads (background
+    prefetch) are counted apart and don't use the rerun budget. Whole-table
+    pulls (SELECT from a table without WHERE or LIMIT) are refused unless
+    the caller passes allow_full_scan=True.
+    """
+
+    def __init__(self, session, settings):
+        self.session = session
+        self.max_queries = int(settings['max_queries_per_rerun'])
+        self.max_query_ms = float(settings['max_query_ms'])
+        self.max_rows = int(settings['max_rows'])
+        self.strict = bool(settings['strict'])
+        self.query_count = 0
+        self.background_query_count = 0
+        self._thread_id = threading.get_ident()
+        self._lock = threading.Lock()
+
+    def sql(self, query, allow_full_scan=False):
+        return GuardedQuery(self, query, allow_full_scan)
+
+    def before_query(self, query, allow_full_scan):
+        if _is_select(query) and _reads_table(query) and not _has_limit(query) \
+                and not _has_filter(query) and not allow_full_scan:
+            self.breach('full_scan', "whole-table SELECT refused", query, refuse=True)
+        
+        with self._lock:
+            if threading.get_ident() != self._thread_id:
+                self.background_query_count += 1
+                return
+            self.query_count += 1
+            over_budget = self.query_count > self.max_queries
+            first_over_budget = self.query_count == self.max_queries + 1
+        if first_over_budget:
+            self.breach('query_budget', f"more than {self.max_queries} queries in one rerun", query)
+        elif over_budget and self.strict:
+            # Logged once per rerun, but every query over the budget fails
+            raise QueryGuardError(f"query_budget: more than {self.max_queries} queries in one rerun")
+
+    def breach(self, kind, detail, query, refuse=False, can_raise=True):
+        """Log a breach, keep it for the admin panel and raise if required"""
+        snippet = ' '.join(query.split())[:200]
+        logger.warning("Query guardrail breach (%s): %s: %s", kind, detail, snippet)
+        get_guard_breaches().appendleft({
+            'TIME': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'KIND': kind,
+            'DETAIL': detail,
+            'QUERY': snippet
+        })
+        if refuse or (self.strict and can_raise):
+            raise QueryGuardError(f"{kind}: {detail}")
+
 # Get the Snowflake session
 # When running on Snowflake, this will automatically connect
 try:
-    session = get_active_session()
+    session = QueryGuard(get_active_session(), _secrets_section('query_guard', QUERY_GUARD_DEFAULTS))
     SNOWFLAKE_MODE = True
 except:
     # For local testing, you'll need to create a session manually
@@ -21,14 +180,6 @@ except:
     SNOWFLAKE_MODE = False
     st.stop()
 
-# Page configuration with branding
-st.set_page_config(
-    page_title="Insurance - Customer Management",
-    page_icon="🔷",  # Using a blue diamond as placeholder
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
-
 #  Brand Colors and Custom CSS
 st.markdown("""
 <style>
@@ -157,17 +308,382 @@ def reset_edit_mode():
     """Reset editing state"""
     st.session_state.editing_customer_id = None
     st.session_state.edit_mode = False
+    st.session_state.pop('editing_record', None)
+
+# ============================================
+# SHARED DATA STORE
+# ============================================
+
+# [shared_store] section of st.secrets
+SHARED_STORE_DEFAULTS = {
+    'memory_budget_mb': 256,        # memory for the datasets shared by all browser sessions
+    'max_age_seconds': 120          # datasets older than this are reloaded on next access
+}
+
+class SharedDataStore:
+    """Process-wide store holding one read-only copy of each dataset.
+
+    Sessions never get their own copy of a dataset: they read the shared
+    DataFrame and keep only arrays of row positions (views). Least recently
+    used datasets are evicted when the memory budget is exceeded, and
+    datasets older than max_age_seconds are reloaded, so changes made
+    outside this process (other containers, procedures, direct SQL) show up.
+    """
+
+    def __init__(self, budget_bytes, max_age_seconds):
+        self.budget_bytes = budget_bytes
+        self.max_age_seconds = max_age_seconds
+        self._entries = {}
+        self._generations = {}
+        self._load_locks = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def _lookup(self, name):
+        entry = self._entries.get(name)
+        now = time.time()
+        if entry is not None and now - entry['loaded_at'] <= self.max_age_seconds:
+            entry['last_access'] = now
+            self._hits += 1
+            return entry['df']
+        return None
+
+    def get(self, name, loader):
+        """Return the shared DataFrame for a dataset, loading it once if missing or expired"""
+        with self._lock:
+            df = self._lookup(name)
+            if df is not None:
+                return df
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+
+        # Only one session loads a dataset, the others wait and reuse it
+        with load_lock:
+            with self._lock:
+                df = self._lookup(name)
+                if df is not None:
+                    return df
+                generation = self._generations.get(name, 0)
+
+            df = loader()
+            nbytes = int(df.memory_usage(index=True, deep=True).sum())
+            now = time.time()
+
+            with self._lock:
+                self._misses += 1
+                # Don't publish data that was invalidated while it was loading
+                if self._generations.get(name, 0) == generation:
+                    self._entries[name] = {
+                        'df': df,
+                        'rows': len(df),
+                        'nbytes': nbytes,
+                        'loaded_at': now,
+                        'last_access': now
+                    }
+                    self._evict(keep=name)
+            return df
+
+    def age(self, name):
+        """Seconds since a dataset was loaded, or None if it is not loaded"""
+        with self._lock:
+            entry = self._entries.get(name)
+            return time.time() - entry['loaded_at'] if entry is not None else None
+
+    def peek(self, name):
+        """Return the shared DataFrame for a dataset if it is loaded and fresh, never loading it"""
+        with self._lock:
+            return self._lookup(name)
+
+    def invalidate(self, name=None):
+        """Drop one dataset (or all of them) so the next access reloads it"""
+        with self._lock:
+            names = [name] if name else set(self._entries) | set(self._load_locks)
+            for dataset in names:
+                self._entries.pop(dataset, None)
+                self._generations[dataset] = self._generations.get(dataset, 0) + 1
+
+    def _used_bytes(self):
+        return sum(entry['nbytes'] for entry in self._entries.values())
+
+    def _evict(self, keep):
+        # A single dataset larger than the budget is kept: it is still
+        # cheaper to share it than to let every session load its own copy
+        while self._used_bytes() > self.budget_bytes and len(self._entries) > 1:
+            victim = min(
+                (n for n in self._entries if n != keep),
+                key=lambda n: self._entries[n]['last_access']
+            )
+            del self._entries[victim]
+            self._evictions += 1
+
+    def stats(self):
+        """Return usage statistics for the store"""
+        with self._lock:
+            now = time.time()
+            return {
+                'budget_bytes': self.budget_bytes,
+                'max_age_seconds': self.max_age_seconds,
+                'used_bytes': self._used_bytes(),
+                'hits': self._hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'datasets': [
+                    {
+                        'DATASET': name,
+                        'ROWS': entry['rows'],
+                        'BYTES': entry['nbytes'],
+                        'AGE_S': round(now - entry['loaded_at'], 1),
+                        'IDLE_S': round(now - entry['last_access'], 1)
+                    }
+                    for name, entry in self._entries.items()
+                ]
+            }
+
+# Customers shown per page in the customer list
+CUSTOMERS_PAGE_SIZE = 25
+
+# Derived column holding the precomputed search text of each customer
+CUSTOMER_SEARCH_COLUMN = '_SEARCH_TEXT'
+
+@st.cache_resource
+def _create_shared_store(budget_mb, max_age_seconds):
+    return SharedDataStore(int(budget_mb * 1024 * 1024), float(max_age_seconds))
+
+def get_shared_store():
+    """Get the data store shared by every session of this app process"""
+    settings = _secrets_section('shared_store', SHARED_STORE_DEFAULTS)
+    return _create_shared_store(settings['memory_budget_mb'], settings['max_age_seconds'])
+
+# ============================================
+# BACKGROUND PREFETCH
+# ============================================
+
+# Worker threads fetching data in the background for all sessions
+PREFETCH_MAX_WORKERS = 4
+# Prefetches a session may have queued: the oldest ones are cancelled first
+PREFETCH_MAX_PENDING_PER_SESSION = 4
+# Cached data younger than this is served as is, older data is served and refreshed
+PREFETCH_FRESH_SECONDS = 30
+# Cached data older than this is never served: get() waits for a fresh load
+PREFETCH_MAX_STALE_SECONDS = 300
+# Cached results kept in memory (least recently used are dropped)
+PREFETCH_MAX_ENTRIES = 500
+
+class PrefetchScheduler:
+    """Stale-while-revalidate cache filled by a bounded pool of background workers.
+
+    get() serves cached data right away (refreshing it in the background when
+    it is stale) and only waits for the warehouse on a cold miss or when the
+    cached data is older than max_stale_seconds. prefetch()
+    queues data a session will probably need next; the prefetches a session
+    has not started yet are cancelled when it moves on (cancel_session).
+    Keys are tuples whose first item is the kind of data, e.g.
+    ('AUDIT_PAGE', 2, 25).
+    """
+
+    def __init__(self, max_workers, fresh_seconds, max_stale_seconds, max_entries, max_pending_per_session):
+        self.fresh_seconds = fresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.max_entries = max_entries
+        self.max_pending_per_session = max_pending_per_session
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='prefetch')
+        # RLock: a future's done-callback runs in the submitting thread if it
+        # is already finished
+        self._lock = threading.RLock()
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._pending = {}
+        self._generations = {}
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'prefetched': 0, 'cancelled': 0}
+
+    def _generation(self, key):
+        return (self._generations.get(key[0], 0), self._generations.get(key, 0))
+
+    def _fetch(self, key, loader, generation):
+        value = loader()
+        with self._lock:
+            # Don't cache data that was invalidated while it was loading
+            if self._generation(key) == generation:
+                self._entries[key] = (value, time.time())
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def _done(self, key, future):
+        with self._lock:
+            if self._inflight.get(key) is future:
+                del self._inflight[key]
+
+    def _submit(self, key, loader):
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._executor.submit(self._fetch, key, loader, self._generation(key))
+            self._inflight[key] = future
+            future.add_done_callback(lambda f, key=key: self._done(key, f))
+        return future
+
+    def get(self, key, loader):
+        """Return cached data (revalidating it if stale), loading it on a cold miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] > self.max_stale_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is not None:
+                value, fetched_at = entry
+                self._entries.move_to_end(key)
+                if time.time() - fetched_at > self.fresh_seconds:
+                    self._stats['stale_hits'] += 1
+                    self._submit(key, loader)
+                else:
+                    self._stats['hits'] += 1
+                return value
+            self._stats['misses'] += 1
+            future = self._inflight.get(key)
+            # A prefetch still waiting in the queue is cancelled and loaded here
+            if future is not None and future.cancel():
+                future = None
+            generation = self._generation(key)
+        
+        if future is not None:
+            try:
+                return future.result()
+            except CancelledError:
+                pass
+        return self._fetch(key, loader, generation)
+
+    def prefetch(self, key, loader, session_id):
+        """Load data in the background unless it is already cached and fresh"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.time() - entry[1] <= self.fresh_seconds:
+                return
+            if key in self._inflight:
+                return
+            
+            future = self._submit(key, loader)
+            self._stats['prefetched'] += 1
+            pending = [f for f in self._pending.get(session_id, []) if not f.done()]
+            pending.append(future)
+            while len(pending) > self.max_pending_per_session:
+                if pending.pop(0).cancel():
+                    self._stats['cancelled'] += 1
+            self._pending[session_id] = pending
+            
+            # Forget sessions whose prefetches are all finished
+            self._pending = {
+                sid: futures for sid, futures in self._pending.items()
+                if any(not f.done() for f in futures)
+            }
+
+    def cancel_session(self, session_id):
+        """Cancel the prefetches of a session that have not started yet"""
+        with self._lock:
+            for future in self._pending.pop(session_id, []):
+                if future.cancel():
+                    self._stats['cancelled'] += 1
+
+    def invalidate(self, key=None, kind=None):
+        """Drop one cached key, every key of a kind, or everything"""
+        with self._lock:
+            if key is not None:
+                self._entries.pop(key, None)
+                self._generations[key] = self._generations.get(key, 0) + 1
+            elif kind is not None:
+                for cached_key in [k for k in self._entries if k[0] == kind]:
+                    del self._entries[cached_key]
+                self._generations[kind] = self._generations.get(kind, 0) + 1
+            else:
+                for cached_key in set(self._entries) | set(self._inflight):
+                    self._generations[cached_key[0]] = self._generations.get(cached_key[0], 0) + 1
+                self._entries.clear()
+
+    def stats(self):
+        """Return usage statistics for the scheduler"""
+        with self._lock:
+            return dict(self._stats, cached=len(self._entries), inflight=len(self._inflight))
+
+@st.cache_resource
+def get_prefetch_scheduler():
+    """Get the prefetch scheduler shared by every session of this app process"""
+    return PrefetchScheduler(
+        PREFETCH_MAX_WORKERS,
+        PREFETCH_FRESH_SECONDS,
+        PREFETCH_MAX_STALE_SECONDS,
+        PREFETCH_MAX_ENTRIES,
+        PREFETCH_MAX_PENDING_PER_SESSION
+    )
+
+def get_prefetch_session_id():
+    """Identify the current browser session for prefetch cancellation"""
+    if 'prefetch_session_id' not in st.session_state:
+        st.session_state.prefetch_session_id = uuid.uuid4().hex
+    return st.session_state.prefetch_session_id
+
+# [app] section of st.secrets: the native app package sets native = true
+APP_DEFAULTS = {
+    'native': False                 # running as a Snowflake Native App
+}
+# Identity used while the entitlements cannot be read: no edits, not cached
+UNKNOWN_IDENTITY = {'user': "UNKNOWN_USER", 'role': None, 'can_edit': False, 'is_admin': False}
+
+def is_native_app():
+    """Whether the app runs inside the Snowflake Native App package"""
+    return bool(_secrets_section('app', APP_DEFAULTS)['native'])
+
+def get_session_identity():
+    """Get the Snowflake user, role and app entitlements, resolved once per browser session
+
+    Inside the native app the entitlements come from the application roles
+    (app_data.session_entitlements_view) and any failure denies edits until
+    a later rerun reads them. A standalone deployment has no application
+    roles: everyone may edit and ADMIN_ROLES are admins.
+    """
+    if 'session_identity' not in st.session_state:
+        try:
+            if is_native_app():
+                row = session.sql(
+                    "SELECT USER_NAME, ROLE_NAME, IS_VIEWER, IS_EDITOR, IS_ADMIN FROM app_data.session_entitlements_view",
+                    allow_full_scan=True
+                ).collect()[0]
+                identity = {
+                    'user': row['USER_NAME'],
+                    'role': row['ROLE_NAME'],
+                    'can_edit': bool(row['IS_EDITOR'] or row['IS_ADMIN']),
+                    'is_admin': bool(row['IS_ADMIN'])
+                }
+            else:
+                identity_query = session.sql("SELECT CURRENT_USER() as user, CURRENT_ROLE() as role").collect()
+                identity = {
+                    'user': identity_query[0]['USER'],
+                    'role': identity_query[0]['ROLE'],
+                    'can_edit': True,
+                    'is_admin': str(identity_query[0]['ROLE']).upper() in ADMIN_ROLES
+                }
+        except QueryGuardError:
+            raise
+        except Exception as e:
+            logger.warning("Could not read the session identity: %s", e)
+            return dict(UNKNOWN_IDENTITY)
+        st.session_state.session_identity = identity
+    return st.session_state.session_identity
 
 def get_current_user():
     """Get current Snowflake user"""
-    try:
-        user_query = session.sql("SELECT CURRENT_USER() as user").collect()
-        return user_query[0]['USER']
-    except:
-        return "UNKNOWN_USER"
+    return get_session_identity()['user']
+
+def can_edit():
+    """Whether the current user may edit customers, merge duplicates and add notes"""
+    return get_session_identity()['can_edit']
 
-def load_customers(filters=None):
-    """Load customers from Snowflake table"""
+def is_admin():
+    """Whether the current user may see the query guardrail breaches"""
+    return get_session_identity()['is_admin']
+
+def _fetch_customers():
+    """Load the CUSTOMERS table from Snowflake (called once per shared store load)"""
     query = """
     SELECT 
         CUSTOMER_ID,
@@ -186,30 +702,57 @@ def load_customers(filters=None):
     ORDER BY CUSTOMER_ID
     """
     
-    df = session.sql(query).to_pandas()
+    # Deliberate whole-table pull: one shared copy for every session
+    df = session.sql(query, allow_full_scan=True).to_pandas()
     
     # Convert string columns to proper types to avoid Snowflake type issues
     string_columns = ['FIRST_NAME', 'LAST_NAME', 'EMAIL', 'PHONE', 'POLICY_TYPE', 'POLICY_NUMBER', 'STATUS', 'LAST_MODIFIED_BY']
     for col in string_columns:
         if col in df.columns:
             df[col] = df[col].astype(str)
-    
-    # Apply filters if provided
+
+    # Lowercased search text computed once per load instead of on every filter
+    # (fields are separated so a term never matches across two of them)
+    df[CUSTOMER_SEARCH_COLUMN] = df['FIRST_NAME'].str.lower()
+    for col in ['LAST_NAME', 'EMAIL', 'POLICY_NUMBER']:
+        df[CUSTOMER_SEARCH_COLUMN] = df[CUSTOMER_SEARCH_COLUMN] + '\x1f' + df[col].str.lower()
+
+    return df
+
+def get_customers_dataset():
+    """Get the shared, read-only CUSTOMERS DataFrame (do not modify it)"""
+    return get_shared_store().get('CUSTOMERS', _fetch_customers)
+
+def invalidate_customer_data():
+    """Drop the shared CUSTOMERS dataset and the data derived from it"""
+    store = get_shared_store()
+    store.invalidate('CUSTOMERS')
+    # Duplicates are recomputed on demand only (see the Duplicati tab)
+    # Every customer change also writes an audit row
+    get_prefetch_scheduler().invalidate(kind='AUDIT_PAGE')
+
+def filter_customer_positions(df, filters=None):
+    """Return the row positions of df matching the filters (no data is copied)"""
+    mask = pd.Series(True, index=df.index)
     if filters:
         if filters.get('status') and filters['status'] != 'All':
-            df = df[df['STATUS'] == filters['status']]
+            mask &= df['STATUS'] == filters['status']
         if filters.get('policy_type') and filters['policy_type'] != 'All':
-            df = df[df['POLICY_TYPE'] == filters['policy_type']]
+            mask &= df['POLICY_TYPE'] == filters['policy_type']
         if filters.get('search'):
             search_term = filters['search'].lower()
-            df = df[
-                df['FIRST_NAME'].str.lower().str.contains(search_term, na=False) |
-                df['LAST_NAME'].str.lower().str.contains(search_term, na=False) |
-                df['EMAIL'].str.lower().str.contains(search_term, na=False) |
-                df['POLICY_NUMBER'].str.lower().str.contains(search_term, na=False)
-            ]
-    
-    return df
+            mask &= df[CUSTOMER_SEARCH_COLUMN].str.contains(search_term, na=False, regex=False)
+    return mask.to_numpy().nonzero()[0]
+
+def load_customer_view(filters=None):
+    """Load customers as (shared DataFrame, positions of the matching rows)"""
+    df = get_customers_dataset()
+    return df, filter_customer_positions(df, filters)
+
+def get_distinct_options(df, column):
+    """Get the sorted distinct values of a shared dataset column for a filter"""
+    values = df[column].dropna().unique().tolist()
+    return sorted(str(x) for x in values if str(x) not in ('None', 'nan'))
 
 def get_customer_by_id(customer_id):
     """Get a specific customer by ID"""
@@ -220,6 +763,61 @@ def get_customer_by_id(customer_id):
     df = session.sql(query).to_pandas()
     return df.iloc[0].to_dict() if not df.empty else None
 
+# The editor re-reads a customer when the shared dataset is older than this
+EDITOR_MAX_RECORD_AGE_SECONDS = 30
+
+def get_customer_record(customer_id, shared_row):
+    """Get the record pre-filling the editor, resolved once per edit.
+
+    The shared CUSTOMERS row holds every column, so it is used as is while
+    the shared dataset is recent; otherwise the record is read again.
+    """
+    cached = st.session_state.get('editing_record')
+    if cached is not None and cached[0] == customer_id:
+        return cached[1]
+    record = shared_row
+    age = get_shared_store().age('CUSTOMERS')
+    if age is None or age > EDITOR_MAX_RECORD_AGE_SECONDS:
+        record = get_customer_by_id(customer_id) or shared_row
+    st.session_state.editing_record = (customer_id, record)
+    return record
+
+def run_atomically(statements):
+    """Run DML statements as a single Snowflake Scripting block: all commit or none.
+
+    The Snowpark session is shared by every browser session of the process,
+    so a transaction opened with separate BEGIN/COMMIT calls would take in
+    other users' statements; one EXECUTE IMMEDIATE call runs on its own.
+    """
+    body = ";\n        ".join(statement.strip() for statement in statements)
+    if '$$' in body:
+        raise ValueError("il testo non può contenere '$$'")
+    block = f"""
+    EXECUTE IMMEDIATE $$
+    BEGIN
+        BEGIN TRANSACTION;
+        {body};
+        COMMIT;
+    EXCEPTION
+        WHEN OTHER THEN
+            ROLLBACK;
+            RAISE;
+    END;
+    $$
+    """
+    session.sql(block).collect()
+
+def _same_value(old_value, new_value):
+    """Whether an edited value equals the stored one (numbers and dates compared by value)"""
+    if str(old_value) == str(new_value):
+        return True
+    for convert in (float, pd.Timestamp):
+        try:
+            return convert(old_value) == convert(new_value)
+        except (TypeError, ValueError):
+            continue
+    return False
+
 def update_customer(customer_id, updates, comment, user):
     """Update customer record and log the change"""
     # Get old values
@@ -251,25 +849,27 @@ def update_customer(customer_id, updates, comment, user):
     """
     
     try:
-        # Execute update
-        session.sql(update_query).collect()
-        
-        # Get new values
-        new_record = get_customer_by_id(customer_id)
-        
         # Escape values for SQL
-        escaped_user = user.replace("'", "''")
         escaped_comment = comment.replace("'", "''")
         
-        # Convert dictionaries to JSON strings and escape for SQL
-        old_json_str = json.dumps(old_record, default=str).replace("'", "''")
-        new_json_str = json.dumps(new_record, default=str).replace("'", "''")
+        # Convert the old values to a JSON string and escape for SQL
+        old_json = json.dumps(old_record, default=str)
+        old_json_str = old_json.replace("'", "''")
+        
+        # Human-readable summary computed once here, not in every viewer
+        new_values = dict(old_record)
+        new_values.update({
+            field: value for field, value in updates.items()
+            if not _same_value(old_record.get(field), value)
+        })
+        new_json = json.dumps(new_values, default=str)
+        escaped_summary = summarize_changes(old_json, new_json).replace("'", "''")
         
         # Insert audit log - explicitly specify columns (exclude AUDIT_ID which is autoincrement)
-        # Use TO_VARIANT to convert JSON string to VARIANT type
+        # NEW_VALUES is the row as written by the UPDATE, read in the same block
         audit_query = f"""
         INSERT INTO CUSTOMER_AUDIT_LOG 
-            (CUSTOMER_ID, MODIFIED_BY, MODIFIED_AT, COMMENT, CHANGE_TYPE, OLD_VALUES, NEW_VALUES)
+            (CUSTOMER_ID, MODIFIED_BY, MODIFIED_AT, COMMENT, CHANGE_TYPE, OLD_VALUES, NEW_VALUES, CHANGE_SUMMARY)
         SELECT 
             {customer_id},
             '{escaped_user}',
@@ -277,14 +877,172 @@ def update_customer(customer_id, updates, comment, user):
             '{escaped_comment}',
             'UPDATE',
             TO_VARIANT(PARSE_JSON('{old_json_str}')),
-            TO_VARIANT(PARSE_JSON('{new_json_str}'))
+            OBJECT_CONSTRUCT_KEEP_NULL(*),
+            '{escaped_summary}'
+        FROM CUSTOMERS
+        WHERE CUSTOMER_ID = {customer_id}
         """
-        session.sql(audit_query).collect()
+        
+        # The UPDATE and its audit row commit together
+        run_atomically([update_query, audit_query])
+        
+        # Every session reads the shared copy: reload it with the new values
+        invalidate_customer_data()
         
         return True, "Customer updated successfully"
+    except QueryGuardError:
+        raise
     except Exception as e:
         return False, f"Error updating customer: {str(e)}"
 
+# ============================================
+# AUDIT CHANGE SUMMARIES
+# ============================================
+
+# Fields updated on every change, left out of the summary
+AUDIT_SUMMARY_SKIP_FIELDS = {'LAST_MODIFIED_BY', 'LAST_MODIFIED_AT'}
+# Longest value shown in a summary before it is shortened with "…"
+AUDIT_SUMMARY_VALUE_CHARS = 12
+# Size of the CHANGE_SUMMARY column
+AUDIT_SUMMARY_MAX_CHARS = 1000
+
+def _audit_values(values):
+    """Turn OLD_VALUES/NEW_VALUES (JSON text or dict) into a dict"""
+    if values is None:
+        return {}
+    if isinstance(values, str):
+        try:
+            values = json.loads(values)
+        except ValueError:
+            return {}
+    return values if isinstance(values, dict) else {}
+
+def _short_value(value):
+    """Shorten a value for the summary, cutting at a word boundary if possible"""
+    text = 'NULL' if value is None else str(value)
+    if len(text) <= AUDIT_SUMMARY_VALUE_CHARS:
+        return text
+    cut = text[:AUDIT_SUMMARY_VALUE_CHARS].rstrip()
+    if ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut + '…'
+
+def summarize_changes(old_values, new_values):
+    """Build a one-line summary of the changed fields (e.g. STATUS: Active → Suspended)"""
+    old_values = _audit_values(old_values)
+    new_values = _audit_values(new_values)
+    
+    changes = []
+    fields = list(new_values) + [f for f in old_values if f not in new_values]
+    for field in fields:
+        if field in AUDIT_SUMMARY_SKIP_FIELDS:
+            continue
+        old_value, new_value = old_values.get(field), new_values.get(field)
+        if str(old_value) != str(new_value):
+            changes.append(f"{field}: {_short_value(old_value)} → {_short_value(new_value)}")
+    
+    summary = '; '.join(changes)
+    if len(summary) > AUDIT_SUMMARY_MAX_CHARS:
+        summary = summary[:AUDIT_SUMMARY_MAX_CHARS - 1] + '…'
+    return summary
+
+# Audit rows summarized per SELECT + UPDATE pair
+AUDIT_BACKFILL_BATCH_SIZE = 500
+# Batches processed by one click on "Genera riepiloghi": each batch costs
+# two queries of the rerun budget
+AUDIT_BACKFILL_BATCHES_PER_RUN = 2
+
+def backfill_audit_summaries(batch_size=AUDIT_BACKFILL_BATCH_SIZE, max_batches=AUDIT_BACKFILL_BATCHES_PER_RUN):
+    """Compute CHANGE_SUMMARY for up to max_batches batches of audit rows written before it existed"""
+    updated = 0
+    try:
+        for _ in range(max_batches):
+            batch_query = f"""
+            SELECT AUDIT_ID, OLD_VALUES, NEW_VALUES
+            FROM CUSTOMER_AUDIT_LOG
+            WHERE CHANGE_SUMMARY IS NULL
+            ORDER BY AUDIT_ID
+            LIMIT {int(batch_size)}
+            """
+            batch = session.sql(batch_query).to_pandas()
+            if batch.empty:
+                break
+            
+            # Rows without changes get an empty summary so they are not picked again
+            value_rows = []
+            for _, row in batch.iterrows():
+                summary = summarize_changes(row['OLD_VALUES'], row['NEW_VALUES'])
+                escaped_summary = summary.replace("'", "''")
+                value_rows.append(f"({int(row['AUDIT_ID'])}, '{escaped_summary}')")
+            values = ", ".join(value_rows)
+            update_query = f"""
+            UPDATE CUSTOMER_AUDIT_LOG a
+            SET CHANGE_SUMMARY = v.CHANGE_SUMMARY
+            FROM (SELECT column1 AS AUDIT_ID, column2 AS CHANGE_SUMMARY FROM VALUES {values}) v
+            WHERE a.AUDIT_ID = v.AUDIT_ID
+            """
+            session.sql(update_query).collect()
+            updated += len(batch)
+            
+            if len(batch) < batch_size:
+                break
+        
+        get_prefetch_scheduler().invalidate(kind='AUDIT_PAGE')
+        return True, f"Riepiloghi generati per {updated} record di audit"
+    except QueryGuardError:
+        raise
+    except Exception as e:
+        return False, f"Errore nella generazione dei riepiloghi ({updated} completati): {str(e)}"
+
+# Audit records shown per page in the audit viewer
+AUDIT_PAGE_SIZE = 25
+
+def _fetch_audit_page(page, page_size):
+    """Load one page of the audit log from Snowflake, newest first"""
+    query = f"""
+    SELECT 
+        a.AUDIT_ID,
+        a.CUSTOMER_ID,
+        c.FIRST_NAME || ' ' || c.LAST_NAME as CUSTOMER_NAME,
+        a.MODIFIED_BY,
+        a.MODIFIED_AT,
+        a.COMMENT,
+        a.CHANGE_TYPE,
+        a.CHANGE_SUMMARY,
+        COUNT(*) OVER () as TOTAL_RECORDS,
+        COUNT_IF(a.CHANGE_SUMMARY IS NULL) OVER () as MISSING_SUMMARIES
+    FROM CUSTOMER_AUDIT_LOG a
+    LEFT JOIN CUSTOMERS c ON a.CUSTOMER_ID = c.CUSTOMER_ID
+    ORDER BY a.AUDIT_ID DESC
+    LIMIT {int(page_size)} OFFSET {int(page) * int(page_size)}
+    """
+    return session.sql(query).to_pandas()
+
+def load_audit_page(page, page_size=AUDIT_PAGE_SIZE):
+    """Load one page of the audit log, served from the prefetch cache when possible"""
+    return get_prefetch_scheduler().get(
+        ('AUDIT_PAGE', int(page), int(page_size)),
+        lambda: _fetch_audit_page(page, page_size)
+    )
+
+def prefetch_audit_page(page, page_size=AUDIT_PAGE_SIZE):
+    """Load a page of the audit log in the background"""
+    get_prefetch_scheduler().prefetch(
+        ('AUDIT_PAGE', int(page), int(page_size)),
+        lambda: _fetch_audit_page(page, page_size),
+        get_prefetch_session_id()
+    )
+
+def load_audit_values(audit_id):
+    """Load the full OLD_VALUES/NEW_VALUES of one audit record"""
+    query = f"""
+    SELECT OLD_VALUES, NEW_VALUES
+    FROM CUSTOMER_AUDIT_LOG
+    WHERE AUDIT_ID = {int(audit_id)}
+    """
+    df = session.sql(query).to_pandas()
+    return df.iloc[0].to_dict() if not df.empty else None
+
 def load_recent_changes(limit=10):
     """Load recent changes from audit log"""
     query = f"""
@@ -295,7 +1053,8 @@ def load_recent_changes(limit=10):
         a.MODIFIED_BY,
         a.MODIFIED_AT,
         a.COMMENT,
-        a.CHANGE_TYPE
+        a.CHANGE_TYPE,
+        a.CHANGE_SUMMARY
     FROM CUSTOMER_AUDIT_LOG a
     LEFT JOIN CUSTOMERS c ON a.CUSTOMER_ID = c.CUSTOMER_ID
     ORDER BY a.MODIFIED_AT DESC
@@ -305,6 +1064,8 @@ def load_recent_changes(limit=10):
     try:
         df = session.sql(query).to_pandas()
         return df
+    except QueryGuardError:
+        raise
     except:
         return pd.DataFrame()
 
@@ -326,9 +1087,275 @@ def load_stream_changes():
     try:
         df = session.sql(query).to_pandas()
         return df
+    except QueryGuardError:
+        raise
     except Exception as e:
         return pd.DataFrame()
 
+# ============================================
+# DUPLICATE DETECTION
+# ============================================
+
+# Blocks larger than this would make the comparison quadratic again: they
+# are split with the DEDUP_SPLIT_KEYS, and skipped only if still too large
+DEDUP_MAX_BLOCK_SIZE = 50
+# Secondary keys splitting the large blocks, applied in this order
+DEDUP_SPLIT_KEYS = ['EMAIL_INITIAL', 'PHONE_PREFIX']
+# Minimum score for two customers to be reported as duplicates
+DEDUP_MIN_SCORE = 0.7
+# Weight of each similarity in the duplicate score (sum = 1)
+DEDUP_WEIGHTS = {'NAME': 0.45, 'PHONE': 0.30, 'EMAIL': 0.25}
+# Size of the character-bigram signatures used for string similarity
+DEDUP_SIGNATURE_BITS = 256
+# Clusters shown in the review tab
+DEDUP_REVIEW_CLUSTERS = 20
+
+SOUNDEX_CODES = {
+    letter: digit
+    for digit, letters in {'1': 'BFPV', '2': 'CGJKQSXZ', '3': 'DT', '4': 'L', '5': 'MN', '6': 'R'}.items()
+    for letter in letters
+}
+POPCOUNT_8 = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint16)
+
+def _ascii_letters(text):
+    """Uppercase text without accents, keeping letters and spaces only"""
+    text = unicodedata.normalize('NFKD', str(text)).encode('ascii', 'ignore').decode()
+    return re.sub(r'[^A-Z ]', '', text.upper())
+
+def soundex(name):
+    """Phonetic code of a name (Rossi and Rosi both give R200)"""
+    letters = _ascii_letters(name).replace(' ', '')
+    if not letters:
+        return ''
+    code = letters[0]
+    previous = SOUNDEX_CODES.get(letters[0], '')
+    for letter in letters[1:]:
+        digit = SOUNDEX_CODES.get(letter, '')
+        if digit and digit != previous:
+            code += digit
+        if letter not in 'HW':
+            previous = digit
+    return (code + '000')[:4]
+
+def normalize_phone(phone):
+    """Digits of a phone number without the Italian country code"""
+    digits = re.sub(r'\D', '', str(phone))
+    if digits.startswith('0039'):
+        digits = digits[4:]
+    elif digits.startswith('39') and len(digits) > 10:
+        digits = digits[2:]
+    return digits if len(digits) >= 6 else ''
+
+def email_local_part(email):
+    """Local part of an email, lowercased, without dots and +tags"""
+    email = str(email).strip().lower()
+    if '@' not in email:
+        return ''
+    return email.split('@', 1)[0].split('+', 1)[0].replace('.', '')
+
+def _name_key(first_name, last_name):
+    """Name tokens in alphabetical order, so swapped first/last names match"""
+    return ' '.join(sorted(_ascii_letters(f"{first_name} {last_name}").lower().split()))
+
+def _bigram_signatures(values):
+    """Hash the character bigrams of each value into a fixed-size bit array"""
+    words = DEDUP_SIGNATURE_BITS // 64
+    signatures = np.zeros((len(values), words), dtype=np.uint64)
+    for i, text in enumerate(values):
+        if not text:
+            continue
+        padded = f" {text} "
+        bits = 0
+        for j in range(len(padded) - 1):
+            bits |= 1 << (zlib.crc32(padded[j:j + 2].encode()) % DEDUP_SIGNATURE_BITS)
+        signatures[i] = [(bits >> (64 * k)) & 0xFFFFFFFFFFFFFFFF for k in range(words)]
+    return signatures
+
+def _popcount(signatures):
+    return POPCOUNT_8[signatures.view(np.uint8)].sum(axis=1)
+
+def _dice_similarity(signatures_a, signatures_b):
+    """Vectorized Dice coefficient of two arrays of bigram signatures"""
+    common = _popcount(signatures_a & signatures_b).astype(float)
+    total = (_popcount(signatures_a) + _popcount(signatures_b)).astype(float)
+    return np.divide(2 * common, total, out=np.zeros_like(total), where=total > 0)
+
+def build_blocking_keys(df):
+    """Blocking keys of each customer: normalized phone, email local part, phonetic name"""
+    return pd.DataFrame({
+        'PHONE': [normalize_phone(p) for p in df['PHONE']],
+        'EMAIL': [email_local_part(e) for e in df['EMAIL']],
+        'NAME': [
+            '|'.join(sorted(code for code in (soundex(first), soundex(last)) if code))
+            for first, last in zip(df['FIRST_NAME'], df['LAST_NAME'])
+        ]
+    })
+
+def build_split_keys(keys):
+    """Secondary keys of each customer: first letter of the email, phone prefix"""
+    return pd.DataFrame({
+        'EMAIL_INITIAL': keys['EMAIL'].str[:1],
+        'PHONE_PREFIX': keys['PHONE'].str[:3]
+    })
+
+def _split_large_blocks(block, split_keys):
+    """Append secondary keys to the keys of the blocks larger than DEDUP_MAX_BLOCK_SIZE"""
+    for column in DEDUP_SPLIT_KEYS:
+        sizes = block.groupby('KEY')['POS'].transform('size')
+        large = (sizes > DEDUP_MAX_BLOCK_SIZE).to_numpy()
+        if not large.any():
+            break
+        secondary = split_keys[column].to_numpy()[block['POS'].to_numpy()[large]]
+        block.loc[large, 'KEY'] = block.loc[large, 'KEY'] + '|' + secondary
+    return block
+
+def find_duplicate_candidates(keys):
+    """Return the (POS_A, POS_B) row pairs sharing at least one blocking key"""
+    positions = np.arange(len(keys))
+    split_keys = build_split_keys(keys)
+    pairs = []
+    for column in keys.columns:
+        block = pd.DataFrame({'KEY': keys[column].to_numpy(), 'POS': positions})
+        block = _split_large_blocks(block[block['KEY'] != ''].copy(), split_keys)
+        sizes = block.groupby('KEY')['POS'].transform('size')
+        block = block[(sizes > 1) & (sizes <= DEDUP_MAX_BLOCK_SIZE)]
+        matches = block.merge(block, on='KEY', suffixes=('_A', '_B'))
+        pairs.append(matches.loc[matches['POS_A'] < matches['POS_B'], ['POS_A', 'POS_B']])
+    return pd.concat(pairs, ignore_index=True).drop_duplicates(ignore_index=True)
+
+def score_duplicate_pairs(df, keys, pairs):
+    """Add a SCORE column (0-1) to the candidate pairs"""
+    pos_a, pos_b = pairs['POS_A'].to_numpy(), pairs['POS_B'].to_numpy()
+    
+    names = [_name_key(first, last) for first, last in zip(df['FIRST_NAME'], df['LAST_NAME'])]
+    name_signatures = _bigram_signatures(names)
+    email_signatures = _bigram_signatures(keys['EMAIL'].tolist())
+    phones = keys['PHONE'].to_numpy()
+    
+    name_score = _dice_similarity(name_signatures[pos_a], name_signatures[pos_b])
+    email_score = _dice_similarity(email_signatures[pos_a], email_signatures[pos_b])
+    phone_score = ((phones[pos_a] == phones[pos_b]) & (phones[pos_a] != '')).astype(float)
+    
+    scored = pairs.copy()
+    scored['SCORE'] = (
+        DEDUP_WEIGHTS['NAME'] * name_score +
+        DEDUP_WEIGHTS['PHONE'] * phone_score +
+        DEDUP_WEIGHTS['EMAIL'] * email_score
+    )
+    return scored
+
+def detect_duplicate_clusters(df):
+    """Group likely duplicate customers into clusters ranked by score"""
+    columns = ['CLUSTER_ID', 'CLUSTER_SCORE', 'CLUSTER_SIZE', 'CUSTOMER_ID', 'FIRST_NAME',
+               'LAST_NAME', 'EMAIL', 'PHONE', 'POLICY_NUMBER', 'STATUS']
+    if len(df) < 2:
+        return pd.DataFrame(columns=columns)
+    
+    keys = build_blocking_keys(df)
+    pairs = find_duplicate_candidates(keys)
+    if pairs.empty:
+        return pd.DataFrame(columns=columns)
+    pairs = score_duplicate_pairs(df, keys, pairs)
+    pairs = pairs[pairs['SCORE'] >= DEDUP_MIN_SCORE]
+    if pairs.empty:
+        return pd.DataFrame(columns=columns)
+    
+    # Union-find over the matching pairs gives the clusters
+    parent = {}
+    def find(pos):
+        parent.setdefault(pos, pos)
+        while parent[pos] != pos:
+            parent[pos] = parent[parent[pos]]
+            pos = parent[pos]
+        return pos
+    for pos_a, pos_b in zip(pairs['POS_A'], pairs['POS_B']):
+        root_a, root_b = find(pos_a), find(pos_b)
+        if root_a != root_b:
+            parent[max(root_a, root_b)] = min(root_a, root_b)
+    
+    members = pd.DataFrame({'POS': list(parent.keys())})
+    members['ROOT'] = [find(pos) for pos in members['POS']]
+    pairs = pairs.assign(ROOT=[find(pos) for pos in pairs['POS_A']])
+    cluster_scores = pairs.groupby('ROOT')['SCORE'].max()
+    
+    clusters = df.iloc[members['POS'].to_numpy()][columns[3:]].reset_index(drop=True)
+    clusters['ROOT'] = members['ROOT'].to_numpy()
+    clusters['CLUSTER_SCORE'] = clusters['ROOT'].map(cluster_scores).round(3)
+    clusters['CLUSTER_SIZE'] = clusters.groupby('ROOT')['CUSTOMER_ID'].transform('size')
+    clusters['CLUSTER_ID'] = clusters.groupby('ROOT')['CUSTOMER_ID'].transform('min')
+    clusters = clusters.sort_values(
+        ['CLUSTER_SCORE', 'CLUSTER_SIZE', 'CLUSTER_ID', 'CUSTOMER_ID'],
+        ascending=[False, False, True, True]
+    )
+    return clusters[columns].reset_index(drop=True)
+
+def get_duplicate_clusters():
+    """Get the duplicate clusters of the shared CUSTOMERS dataset, computing them if missing"""
+    return get_shared_store().get(
+        'CUSTOMER_DUPLICATES',
+        lambda: detect_duplicate_clusters(get_customers_dataset())
+    )
+
+def merge_customers(survivor_id, duplicate_ids, comment, user):
+    """Merge duplicate customers into the survivor and log each merge"""
+    survivor_id = int(survivor_id)
+    duplicate_ids = [int(d) for d in duplicate_ids if int(d) != survivor_id]
+    if not duplicate_ids:
+        return False, "Nessun duplicato da unire"
+    
+    id_list = ', '.join(str(d) for d in [survivor_id] + duplicate_ids)
+    try:
+        records = session.sql(f"SELECT * FROM CUSTOMERS WHERE CUSTOMER_ID IN ({id_list})").to_pandas()
+        records = {int(r['CUSTOMER_ID']): r.to_dict() for _, r in records.iterrows()}
+        if survivor_id not in records:
+            return False, "Customer not found"
+        duplicate_ids = [d for d in duplicate_ids if d in records]
+        
+        # Every CUSTOMERS row is a policy: deleting a row with another policy
+        # number would drop a live policy
+        policy_numbers = {str(records[c]['POLICY_NUMBER']) for c in [survivor_id] + duplicate_ids}
+        if len(policy_numbers) > 1:
+            return False, f"I clienti hanno polizze diverse ({', '.join(sorted(policy_numbers))}): unione non consentita"
+        
+        escaped_user = user.replace("'", "''")
+        escaped_comment = comment.replace("'", "''")
+        survivor_json = json.dumps(records[survivor_id], default=str).replace("'", "''")
+        summary = f"Unito nel cliente #{survivor_id}".replace("'", "''")
+        
+        # One audit row per merged customer, keeping its full record as OLD_VALUES
+        audit_rows = []
+        for duplicate_id in duplicate_ids:
+            duplicate_json = json.dumps(records[duplicate_id], default=str).replace("'", "''")
+            audit_rows.append(f"""
+        SELECT 
+            {duplicate_id},
+            '{escaped_user}',
+            CURRENT_TIMESTAMP(),
+            '{escaped_comment}',
+            'MERGE',
+            TO_VARIANT(PARSE_JSON('{duplicate_json}')),
+            TO_VARIANT(PARSE_JSON('{survivor_json}')),
+            '{summary}'""")
+        audit_select = " UNION ALL".join(audit_rows)
+        audit_query = f"""
+        INSERT INTO CUSTOMER_AUDIT_LOG 
+            (CUSTOMER_ID, MODIFIED_BY, MODIFIED_AT, COMMENT, CHANGE_TYPE, OLD_VALUES, NEW_VALUES, CHANGE_SUMMARY)
+        {audit_select}
+        """
+        delete_ids = ', '.join(str(d) for d in duplicate_ids)
+        
+        # Audit rows and DELETE commit together: no audit row claims a merge that failed
+        run_atomically([audit_query, f"DELETE FROM CUSTOMERS WHERE CUSTOMER_ID IN ({delete_ids})"])
+        
+        invalidate_customer_data()
+        get_shared_store().invalidate('CUSTOMER_DUPLICATES')
+        
+        return True, f"{len(duplicate_ids)} cliente/i unito/i nel cliente #{survivor_id}"
+    except QueryGuardError:
+        raise
+    except Exception as e:
+        return False, f"Errore nell'unione dei clienti: {str(e)}"
+
 def save_table_note(table_name, note_text, user):
     """Save a note for a table and send email notification"""
     try:
@@ -346,15 +1373,20 @@ def save_table_note(table_name, note_text, user):
         VALUES ('{escaped_table}', '{escaped_note}', '{escaped_user}')
         """
         session.sql(note_query).collect()
+        clear_notes_cache()
         
         # Send email notification
         try:
             send_note_email_notification(table_name, user, note_text, timestamp)
+        except QueryGuardError:
+            raise
         except Exception as email_error:
             # Don't fail if email fails, just log it
             print(f"Email notification failed: {str(email_error)}")
         
         return True, "Nota salvata con successo"
+    except QueryGuardError:
+        raise
     except Exception as e:
         return False, f"Errore nel salvare la nota: {str(e)}"
 
@@ -404,29 +1436,103 @@ Questa è una notifica automatica dal sistema Unipol Customer Management System.
         result = session.sql(email_query).collect()
         return True
         
+    except QueryGuardError:
+        raise
     except Exception as e:
         # Log error but don't fail the note save operation
         print(f"Failed to send email: {str(e)}")
         return False
 
-def get_latest_note(table_name):
-    """Get the latest note for a table"""
+# ============================================
+# TABLE NOTES
+# ============================================
+
+# Tables that can be selected in the app and carry notes
+REGISTERED_TABLES = ["CUSTOMERS", "CUSTOMER_AUDIT_LOG"]
+# Notes shown per page of the note history
+NOTE_HISTORY_PAGE_SIZE = 10
+# How long (seconds) note queries are cached; saving a note clears the cache
+NOTES_CACHE_TTL_SECONDS = 30
+
+@st.cache_data(ttl=NOTES_CACHE_TTL_SECONDS, show_spinner=False)
+def load_notes_overview(user, tables=tuple(REGISTERED_TABLES)):
+    """Latest note and unread count of every registered table, in a single query"""
+    escaped_user = user.replace("'", "''")
+    table_list = ", ".join("'" + t.replace("'", "''") + "'" for t in tables)
+    query = f"""
+    SELECT 
+        n.TABLE_NAME,
+        n.NOTE_ID,
+        n.NOTE_TEXT,
+        n.CREATED_BY,
+        n.CREATED_AT,
+        COUNT_IF(
+            n.CREATED_AT > COALESCE(r.LAST_READ_AT, '1970-01-01'::TIMESTAMP_NTZ)
+            AND n.CREATED_BY <> '{escaped_user}'
+        ) OVER (PARTITION BY n.TABLE_NAME) as UNREAD_COUNT
+    FROM TABLE_NOTES n
+    LEFT JOIN NOTE_READS r
+        ON r.TABLE_NAME = n.TABLE_NAME AND r.USER_NAME = '{escaped_user}'
+    WHERE n.TABLE_NAME IN ({table_list})
+    QUALIFY ROW_NUMBER() OVER (PARTITION BY n.TABLE_NAME ORDER BY n.CREATED_AT DESC, n.NOTE_ID DESC) = 1
+    """
     try:
-        query = f"""
-        SELECT 
-            NOTE_ID,
-            NOTE_TEXT,
-            CREATED_BY,
-            CREATED_AT
-        FROM TABLE_NOTES
-        WHERE TABLE_NAME = '{table_name}'
-        ORDER BY CREATED_AT DESC
-        LIMIT 1
-        """
         df = session.sql(query).to_pandas()
-        return df.iloc[0].to_dict() if not df.empty else None
+        return {row['TABLE_NAME']: row.to_dict() for _, row in df.iterrows()}
+    except QueryGuardError:
+        raise
     except:
-        return None
+        return {}
+
+@st.cache_data(ttl=NOTES_CACHE_TTL_SECONDS, show_spinner=False)
+def load_note_history(table_name, page=0, page_size=NOTE_HISTORY_PAGE_SIZE):
+    """Load one page of a table's notes, newest first; returns (notes, has_more)"""
+    escaped_table = table_name.replace("'", "''")
+    # One extra row tells whether there is a next page
+    query = f"""
+    SELECT 
+        NOTE_ID,
+        NOTE_TEXT,
+        CREATED_BY,
+        CREATED_AT
+    FROM TABLE_NOTES
+    WHERE TABLE_NAME = '{escaped_table}'
+    ORDER BY CREATED_AT DESC, NOTE_ID DESC
+    LIMIT {int(page_size) + 1} OFFSET {int(page) * int(page_size)}
+    """
+    try:
+        df = session.sql(query).to_pandas()
+        return df.head(page_size), len(df) > page_size
+    except QueryGuardError:
+        raise
+    except:
+        return pd.DataFrame(), False
+
+def clear_notes_cache():
+    """Forget cached notes after a note is saved or read"""
+    load_notes_overview.clear()
+    load_note_history.clear()
+
+def mark_notes_read(table_name, user):
+    """Mark all current notes of a table as read by the user"""
+    escaped_table = table_name.replace("'", "''")
+    escaped_user = user.replace("'", "''")
+    query = f"""
+    MERGE INTO NOTE_READS r
+    USING (SELECT '{escaped_user}' as USER_NAME, '{escaped_table}' as TABLE_NAME) s
+        ON r.USER_NAME = s.USER_NAME AND r.TABLE_NAME = s.TABLE_NAME
+    WHEN MATCHED THEN UPDATE SET LAST_READ_AT = CURRENT_TIMESTAMP()
+    WHEN NOT MATCHED THEN INSERT (USER_NAME, TABLE_NAME, LAST_READ_AT)
+        VALUES (s.USER_NAME, s.TABLE_NAME, CURRENT_TIMESTAMP())
+    """
+    try:
+        session.sql(query).collect()
+        clear_notes_cache()
+        return True, "Note segnate come lette"
+    except QueryGuardError:
+        raise
+    except Exception as e:
+        return False, f"Errore nell'aggiornare le note lette: {str(e)}"
 
 # ============================================
 # MAIN APPLICATION
@@ -446,23 +1552,43 @@ st.markdown("""
 
 st.markdown("<br>", unsafe_allow_html=True)
 
+# Prefetches queued by this session's previous rerun are no longer needed
+get_prefetch_scheduler().cancel_session(get_prefetch_session_id())
+
 # Get current user
 current_user = get_current_user()
 st.sidebar.info(f"👤 Utente: **{current_user}**")
 
+# Latest note and unread count of every table (one query, cached)
+notes_overview = load_notes_overview(current_user)
+
+def format_unread_badges():
+    """Unread notes badge of each table that has some, e.g. 'CUSTOMERS (🔔 2)'"""
+    badges = []
+    for table_name in REGISTERED_TABLES:
+        unread = int(notes_overview.get(table_name, {}).get('UNREAD_COUNT') or 0)
+        if unread:
+            badges.append(f"{table_name} (🔔 {unread})")
+    return " · ".join(badges)
+
 # ============================================
 # TABLE SELECTOR
 # ============================================
 
 st.sidebar.markdown('<h3 style="color: #003d7a;">📊 Selezione Tabella</h3>', unsafe_allow_html=True)
 
-# Table selector
+# Table selector: the options must not change between reruns, otherwise
+# Streamlit sees a new widget and resets the selection, so the unread
+# badges are shown apart
 selected_table = st.sidebar.selectbox(
     "Tabella da visualizzare",
-    ["CUSTOMERS", "CUSTOMER_AUDIT_LOG"],
+    REGISTERED_TABLES,
     index=0,
     help="Seleziona quale tabella visualizzare"
 )
+unread_badges = format_unread_badges()
+if unread_badges:
+    st.sidebar.caption(f"Note non lette: {unread_badges}")
 
 st.sidebar.markdown("---")
 
@@ -472,11 +1598,13 @@ st.sidebar.markdown("---")
 
 st.sidebar.markdown('<h3 style="color: #003d7a;">🔍 Filtri</h3>', unsafe_allow_html=True)
 
-# Get unique values for filters
+# Get unique values for filters (from the shared dataset, no extra query)
 try:
-    all_customers = session.sql("SELECT DISTINCT STATUS, POLICY_TYPE FROM CUSTOMERS").to_pandas()
-    status_options = ['All'] + sorted([str(x) for x in all_customers['STATUS'].dropna().unique().tolist()])
-    policy_type_options = ['All'] + sorted([str(x) for x in all_customers['POLICY_TYPE'].dropna().unique().tolist()])
+    all_customers = get_customers_dataset()
+    status_options = ['All'] + get_distinct_options(all_customers, 'STATUS')
+    policy_type_options = ['All'] + get_distinct_options(all_customers, 'POLICY_TYPE')
+except QueryGuardError:
+    raise
 except:
     status_options = ['All']
     policy_type_options = ['All']
@@ -493,9 +1621,46 @@ filters = {
 
 if st.sidebar.button("🔄 Refresh Data"):
     st.session_state.refresh_trigger += 1
+    get_shared_store().invalidate()
+    get_prefetch_scheduler().invalidate()
+    clear_notes_cache()
     reset_edit_mode()
     st.rerun()
 
+# Shared data store statistics
+with st.sidebar.expander("🧠 Cache Dati Condivisa"):
+    store_stats = get_shared_store().stats()
+    st.caption(
+        f"Memoria: {store_stats['used_bytes'] / 1024 / 1024:.1f} / "
+        f"{store_stats['budget_bytes'] / 1024 / 1024:.0f} MB · "
+        f"Età massima: {store_stats['max_age_seconds']:.0f} s"
+    )
+    st.caption(
+        f"Hit: {store_stats['hits']} · Miss: {store_stats['misses']} · "
+        f"Evictions: {store_stats['evictions']}"
+    )
+    if store_stats['datasets']:
+        st.dataframe(pd.DataFrame(store_stats['datasets']), hide_index=True, use_container_width=True)
+    prefetch_stats = get_prefetch_scheduler().stats()
+    st.caption(
+        f"Prefetch: {prefetch_stats['prefetched']} · Hit: {prefetch_stats['hits']} · "
+        f"Stale: {prefetch_stats['stale_hits']} · Miss: {prefetch_stats['misses']} · "
+        f"Annullati: {prefetch_stats['cancelled']}"
+    )
+
+# Query guardrail breaches (admins only)
+if is_admin():
+    guard_breaches = list(get_guard_breaches())
+    with st.sidebar.expander(f"🚨 Guardrail Query ({len(guard_breaches)})"):
+        st.caption(
+            f"Limiti: {session.max_queries} query/rerun · {session.max_query_ms:.0f} ms/query · "
+            f"{session.max_rows} righe per SELECT senza LIMIT"
+        )
+        if guard_breaches:
+            st.dataframe(pd.DataFrame(guard_breaches), hide_index=True, use_container_width=True)
+        else:
+            st.caption("Nessuna violazione registrata")
+
 # ============================================
 # MAIN TABLE SECTION
 # ============================================
@@ -508,7 +1673,7 @@ if selected_table == "CUSTOMERS":
         st.markdown('<h2 style="color: #003d7a; margin-top: 2rem;">📋 Anagrafica Clienti</h2>', unsafe_allow_html=True)
     with header_col2:
         st.markdown("<br>", unsafe_allow_html=True)
-        if st.button("📝 Note", key="notes_button", help="Aggiungi nota alla tabella"):
+        if can_edit() and st.button("📝 Note", key="notes_button", help="Aggiungi nota alla tabella"):
             st.session_state.show_note_form = not st.session_state.get('show_note_form', False)
     
     # Note form (if button clicked)
@@ -540,16 +1705,25 @@ if selected_table == "CUSTOMERS":
                     st.session_state.show_note_form = False
                     st.rerun()
     
-    # Load customers
-    customers_df = load_customers(filters)
+    # Load customers (shared dataset + positions of the filtered rows)
+    customers_df, customer_positions = load_customer_view(filters)
 
-    if customers_df.empty:
+    if len(customer_positions) == 0:
         st.warning("No customers found matching the filters.")
     else:
-        st.info(f"Showing **{len(customers_df)}** customer(s)")
+        # Back to the first page whenever the filters change
+        if st.session_state.get('customer_page_filters') != filters:
+            st.session_state.customer_page_filters = dict(filters)
+            st.session_state.customer_page = 0
+        page_count = (len(customer_positions) - 1) // CUSTOMERS_PAGE_SIZE + 1
+        customer_page = min(st.session_state.get('customer_page', 0), page_count - 1)
+        page_positions = customer_positions[customer_page * CUSTOMERS_PAGE_SIZE:(customer_page + 1) * CUSTOMERS_PAGE_SIZE]
+        
+        st.info(f"Showing **{len(customer_positions)}** customer(s)")
         
         # Display customers with edit buttons
-        for idx, row in customers_df.iterrows():
+        for position in page_positions:
+            row = customers_df.iloc[position]
             with st.container():
                 col1, col2 = st.columns([6, 1])
             
@@ -585,26 +1759,29 @@ if selected_table == "CUSTOMERS":
                         st.markdown("---")
                         st.subheader("✏️ Edit Customer Information")
                         
+                        # Shared row, re-read from Snowflake only when it may be stale
+                        record = get_customer_record(customer_id, row.to_dict())
+                        
                         edit_col1, edit_col2 = st.columns(2)
                         
                         with edit_col1:
-                            new_first_name = st.text_input("First Name", value=str(row['FIRST_NAME']), key=f"fn_{customer_id}")
-                            new_last_name = st.text_input("Last Name", value=str(row['LAST_NAME']), key=f"ln_{customer_id}")
-                            new_email = st.text_input("Email", value=str(row['EMAIL']), key=f"email_{customer_id}")
-                            new_phone = st.text_input("Phone", value=str(row['PHONE']), key=f"phone_{customer_id}")
+                            new_first_name = st.text_input("First Name", value=str(record['FIRST_NAME']), key=f"fn_{customer_id}")
+                            new_last_name = st.text_input("Last Name", value=str(record['LAST_NAME']), key=f"ln_{customer_id}")
+                            new_email = st.text_input("Email", value=str(record['EMAIL']), key=f"email_{customer_id}")
+                            new_phone = st.text_input("Phone", value=str(record['PHONE']), key=f"phone_{customer_id}")
                         
                         with edit_col2:
-                            policy_type_str = str(row['POLICY_TYPE'])
+                            policy_type_str = str(record['POLICY_TYPE'])
                             new_policy_type = st.selectbox(
                                 "Policy Type", 
                                 ['Auto', 'Home', 'Life', 'Health'],
                                 index=['Auto', 'Home', 'Life', 'Health'].index(policy_type_str) if policy_type_str in ['Auto', 'Home', 'Life', 'Health'] else 0,
                                 key=f"pt_{customer_id}"
                             )
-                            new_policy_number = st.text_input("Policy Number", value=str(row['POLICY_NUMBER']), key=f"pn_{customer_id}")
-                            premium_value = float(row['PREMIUM_AMOUNT']) if row['PREMIUM_AMOUNT'] is not None else 0.0
+                            new_policy_number = st.text_input("Policy Number", value=str(record['POLICY_NUMBER']), key=f"pn_{customer_id}")
+                            premium_value = float(record['PREMIUM_AMOUNT']) if record['PREMIUM_AMOUNT'] is not None else 0.0
                             new_premium = st.number_input("Premium Amount", value=premium_value, min_value=0.0, key=f"prem_{customer_id}")
-                            status_str = str(row['STATUS'])
+                            status_str = str(record['STATUS'])
                             new_status = st.selectbox(
                                 "Status", 
                                 ['Active', 'Pending', 'Suspended', 'Cancelled'],
@@ -657,38 +1834,68 @@ if selected_table == "CUSTOMERS":
             
             with col2:
                 # Edit button
-                if st.session_state.editing_customer_id != customer_id:
+                if st.session_state.editing_customer_id != customer_id and can_edit():
                     if st.button("✏️ Edit Record", key=f"edit_btn_{customer_id}", type="secondary"):
                         st.session_state.editing_customer_id = customer_id
                         st.rerun()
+        
+        # Page navigation
+        if page_count > 1:
+            nav_col1, nav_col2, nav_col3 = st.columns([1, 1, 4])
+            with nav_col1:
+                if customer_page > 0 and st.button("⬅️ Precedente", key="customer_prev_page"):
+                    st.session_state.customer_page = customer_page - 1
+                    reset_edit_mode()
+                    st.rerun()
+            with nav_col2:
+                if customer_page < page_count - 1 and st.button("Successiva ➡️", key="customer_next_page"):
+                    st.session_state.customer_page = customer_page + 1
+                    reset_edit_mode()
+                    st.rerun()
+            with nav_col3:
+                st.caption(f"Pagina {customer_page + 1} di {page_count}")
+
 
 elif selected_table == "CUSTOMER_AUDIT_LOG":
     st.markdown('<h2 style="color: #003d7a; margin-top: 2rem;">📝 Registro Audit Completo</h2>', unsafe_allow_html=True)
     
-    # Load all audit log records
-    audit_query = """
-    SELECT 
-        a.AUDIT_ID,
-        a.CUSTOMER_ID,
-        c.FIRST_NAME || ' ' || c.LAST_NAME as CUSTOMER_NAME,
-        a.MODIFIED_BY,
-        a.MODIFIED_AT,
-        a.COMMENT,
-        a.CHANGE_TYPE,
-        a.OLD_VALUES,
-        a.NEW_VALUES
-    FROM CUSTOMER_AUDIT_LOG a
-    LEFT JOIN CUSTOMERS c ON a.CUSTOMER_ID = c.CUSTOMER_ID
-    ORDER BY a.AUDIT_ID DESC
-    """
+    # Load one page of audit log records (next page is prefetched below)
+    audit_page = st.session_state.get('audit_page', 0)
     
     try:
-        audit_df = session.sql(audit_query).to_pandas()
+        audit_df = load_audit_page(audit_page)
+        if audit_df.empty and audit_page > 0:
+            audit_page = st.session_state.audit_page = 0
+            audit_df = load_audit_page(audit_page)
         
         if audit_df.empty:
             st.info("📋 Nessuna modifica registrata nel log di audit.")
         else:
-            st.info(f"Visualizzazione di **{len(audit_df)}** record di audit")
+            total_records = int(audit_df['TOTAL_RECORDS'].iloc[0])
+            audit_page_count = (total_records - 1) // AUDIT_PAGE_SIZE + 1
+            st.info(f"Visualizzazione di **{len(audit_df)}** di **{total_records}** record di audit")
+            
+            # Records written before CHANGE_SUMMARY existed
+            missing_summaries = int(audit_df['MISSING_SUMMARIES'].iloc[0])
+            if missing_summaries > 0:
+                missing_col1, missing_col2 = st.columns([4, 1])
+                with missing_col1:
+                    st.warning(
+                        f"⚠️ {missing_summaries} record senza riepilogo delle modifiche "
+                        f"(fino a {AUDIT_BACKFILL_BATCH_SIZE * AUDIT_BACKFILL_BATCHES_PER_RUN} per clic)"
+                    )
+                with missing_col2:
+                    if can_edit() and st.button("⚙️ Genera riepiloghi", key="backfill_summaries"):
+                        with st.spinner("Generazione riepiloghi in corso..."):
+                            success, message = backfill_audit_summaries()
+                        if success:
+                            st.success(f"✅ {message}")
+                            st.rerun()
+                        else:
+                            st.error(f"❌ {message}")
+            
+            if 'audit_json_ids' not in st.session_state:
+                st.session_state.audit_json_ids = set()
             
             # Display audit records in expandable cards
             for idx, row in audit_df.iterrows():
@@ -708,27 +1915,67 @@ elif selected_table == "CUSTOMER_AUDIT_LOG":
                         st.markdown(f"**Data/Ora:** {str(row['MODIFIED_AT'])}")
                         st.markdown(f"**Commento:** {str(row['COMMENT'])}")
                     
-                    # Show JSON data if available
-                    if row['OLD_VALUES'] is not None or row['NEW_VALUES'] is not None:
-                        st.markdown("---")
-                        st.markdown("**📊 Dettagli Modifiche:**")
+                    # Precomputed change summary (plain text)
+                    st.markdown("---")
+                    st.markdown("**📊 Dettagli Modifiche:**")
+                    change_summary = row['CHANGE_SUMMARY']
+                    if pd.isna(change_summary):
+                        st.text("Riepilogo non ancora disponibile")
+                    else:
+                        st.text(str(change_summary) or "Nessun campo modificato")
+                    
+                    # Full JSON is loaded only on request
+                    audit_id = int(row['AUDIT_ID'])
+                    showing_json = audit_id in st.session_state.audit_json_ids
+                    if st.button(
+                        "🙈 Nascondi JSON" if showing_json else "🔎 Mostra JSON completo",
+                        key=f"json_btn_{audit_id}"
+                    ):
+                        if showing_json:
+                            st.session_state.audit_json_ids.discard(audit_id)
+                        else:
+                            st.session_state.audit_json_ids.add(audit_id)
+                        st.rerun()
+                    
+                    if showing_json:
+                        audit_values = load_audit_values(audit_id) or {}
                         
                         json_col1, json_col2 = st.columns(2)
                         
                         with json_col1:
                             st.markdown("**Valori Precedenti:**")
-                            if row['OLD_VALUES'] is not None:
-                                st.json(str(row['OLD_VALUES']))
+                            if audit_values.get('OLD_VALUES') is not None:
+                                st.json(str(audit_values['OLD_VALUES']))
                             else:
                                 st.text("N/A")
                         
                         with json_col2:
                             st.markdown("**Nuovi Valori:**")
-                            if row['NEW_VALUES'] is not None:
-                                st.json(str(row['NEW_VALUES']))
+                            if audit_values.get('NEW_VALUES') is not None:
+                                st.json(str(audit_values['NEW_VALUES']))
                             else:
                                 st.text("N/A")
+            
+            # Page navigation
+            if audit_page_count > 1:
+                nav_col1, nav_col2, nav_col3 = st.columns([1, 1, 4])
+                with nav_col1:
+                    if audit_page > 0 and st.button("⬅️ Più recenti", key="audit_prev_page"):
+                        st.session_state.audit_page = audit_page - 1
+                        st.rerun()
+                with nav_col2:
+                    if audit_page < audit_page_count - 1 and st.button("Meno recenti ➡️", key="audit_next_page"):
+                        st.session_state.audit_page = audit_page + 1
+                        st.rerun()
+                with nav_col3:
+                    st.caption(f"Pagina {audit_page + 1} di {audit_page_count}")
+            
+            # Warm the next page while the user reads this one
+            if audit_page < audit_page_count - 1:
+                prefetch_audit_page(audit_page + 1)
     
+    except QueryGuardError:
+        raise
     except Exception as e:
         st.error(f"Errore nel caricamento del log di audit: {str(e)}")
 
@@ -740,7 +1987,7 @@ st.markdown("---")
 
 st.markdown('<h2 style="color: #003d7a; margin-top: 3rem;">📊 Registro Modifiche & Attività</h2>', unsafe_allow_html=True)
 
-tab1, tab2 = st.tabs(["📝 Audit Log", "🔄 Stream Changes"])
+tab1, tab2, tab3 = st.tabs(["📝 Audit Log", "🔄 Stream Changes", "👥 Duplicati"])
 
 with tab1:
     st.subheader("Latest Updates")
@@ -763,7 +2010,8 @@ with tab1:
                 "MODIFIED_BY": "Modified By",
                 "MODIFIED_AT": "Timestamp",
                 "COMMENT": "Comment",
-                "CHANGE_TYPE": "Type"
+                "CHANGE_TYPE": "Type",
+                "CHANGE_SUMMARY": "Changes"
             },
             hide_index=True,
             use_container_width=True
@@ -792,6 +2040,77 @@ with tab2:
             use_container_width=True
         )
 
+with tab3:
+    st.subheader("Possibili Clienti Duplicati")
+    st.caption("Clienti con telefono, email o nome (anche invertito) simili, ordinati per punteggio")
+    
+    # The search reads the whole table: it only runs when asked for
+    duplicates_df = get_shared_store().peek('CUSTOMER_DUPLICATES')
+    search_label = "🔍 Cerca duplicati" if duplicates_df is None else "🔄 Ricalcola duplicati"
+    if st.button(search_label, key="find_duplicates"):
+        get_shared_store().invalidate('CUSTOMER_DUPLICATES')
+        with st.spinner("Ricerca duplicati in corso..."):
+            try:
+                duplicates_df = get_duplicate_clusters()
+            except QueryGuardError:
+                raise
+            except Exception as e:
+                duplicates_df = None
+                st.error(f"Errore nella ricerca dei duplicati: {str(e)}")
+    
+    if duplicates_df is None:
+        st.info("Premi \"Cerca duplicati\" per confrontare i clienti.")
+    elif duplicates_df.empty:
+        st.info("Nessun possibile duplicato trovato.")
+    else:
+        cluster_ids = duplicates_df['CLUSTER_ID'].drop_duplicates().tolist()
+        st.info(f"**{len(cluster_ids)}** gruppo/i di possibili duplicati")
+        
+        for cluster_id in cluster_ids[:DEDUP_REVIEW_CLUSTERS]:
+            cluster = duplicates_df[duplicates_df['CLUSTER_ID'] == cluster_id]
+            cluster_score = float(cluster['CLUSTER_SCORE'].iloc[0])
+            names = ", ".join(f"{r['FIRST_NAME']} {r['LAST_NAME']}" for _, r in cluster.iterrows())
+            
+            with st.expander(f"👥 {names} (punteggio {cluster_score:.2f})"):
+                st.dataframe(
+                    cluster.drop(columns=['CLUSTER_ID', 'CLUSTER_SCORE', 'CLUSTER_SIZE']),
+                    hide_index=True,
+                    use_container_width=True
+                )
+                
+                # Merging is an edit: viewers only review the candidates
+                if not can_edit():
+                    continue
+                # Rows with different policies are separate policies of one person
+                if cluster['POLICY_NUMBER'].astype(str).nunique() > 1:
+                    st.warning("⚠️ Polizze diverse: verificare i dati, l'unione non è consentita")
+                    continue
+                
+                member_ids = [int(c) for c in cluster['CUSTOMER_ID']]
+                survivor_id = st.selectbox(
+                    "Cliente da mantenere",
+                    member_ids,
+                    format_func=lambda c, cluster=cluster: "#{} - {} {} ({})".format(
+                        c, *cluster.loc[cluster['CUSTOMER_ID'] == c, ['FIRST_NAME', 'LAST_NAME', 'POLICY_NUMBER']].iloc[0]
+                    ),
+                    key=f"merge_survivor_{cluster_id}"
+                )
+                merge_comment = st.text_area(
+                    "Comment (required)",
+                    placeholder="Motivo dell'unione...",
+                    key=f"merge_comment_{cluster_id}"
+                )
+                if st.button("🔗 Unisci duplicati", key=f"merge_btn_{cluster_id}", type="primary"):
+                    if not merge_comment or merge_comment.strip() == "":
+                        st.error("⚠️ Please provide a comment describing the changes.")
+                    else:
+                        success, message = merge_customers(survivor_id, member_ids, merge_comment, current_user)
+                        if success:
+                            st.success(f"✅ {message}")
+                            st.rerun()
+                        else:
+                            st.error(f"❌ {message}")
+
 # ============================================
 # LATEST NOTE SECTION
 # ============================================
@@ -799,10 +2118,12 @@ with tab2:
 st.markdown("<br><br>", unsafe_allow_html=True)
 st.markdown("---")
 
-# Display latest note if exists
-latest_note = get_latest_note(selected_table)
+# Display latest note if exists (from the notes overview, no extra query)
+latest_note = notes_overview.get(selected_table)
 if latest_note:
-    st.markdown('<h3 style="color: #003d7a;">📌 Ultima Nota</h3>', unsafe_allow_html=True)
+    unread_notes = int(latest_note.get('UNREAD_COUNT') or 0)
+    unread_badge = f" <span style=\"color: #e30613;\">🔔 {unread_notes} non lette</span>" if unread_notes else ""
+    st.markdown(f'<h3 style="color: #003d7a;">📌 Ultima Nota{unread_badge}</h3>', unsafe_allow_html=True)
     
     note_col1, note_col2 = st.columns([4, 1])
     with note_col1:
@@ -810,6 +2131,47 @@ if latest_note:
     with note_col2:
         st.caption(f"**👤 {latest_note['CREATED_BY']}**")
         st.caption(f"🕒 {str(latest_note['CREATED_AT'])}")
+    
+    history_key = f"show_note_history_{selected_table}"
+    page_key = f"note_history_page_{selected_table}"
+    
+    action_col1, action_col2, action_col3 = st.columns([1, 1, 4])
+    with action_col1:
+        if st.button("📚 Storico note", key=f"note_history_btn_{selected_table}"):
+            st.session_state[history_key] = not st.session_state.get(history_key, False)
+            st.session_state[page_key] = 0
+    with action_col2:
+        if unread_notes and st.button("✔️ Segna come lette", key=f"mark_read_{selected_table}"):
+            success, message = mark_notes_read(selected_table, current_user)
+            if success:
+                st.rerun()
+            else:
+                st.error(f"❌ {message}")
+    
+    # Paginated note history
+    if st.session_state.get(history_key, False):
+        page = st.session_state.get(page_key, 0)
+        history_df, has_more = load_note_history(selected_table, page)
+        
+        for _, note in history_df.iterrows():
+            st.markdown(f"💬 {note['NOTE_TEXT']}")
+            st.caption(f"👤 {note['CREATED_BY']} · 🕒 {str(note['CREATED_AT'])}")
+        
+        page_col1, page_col2, page_col3 = st.columns([1, 1, 4])
+        with page_col1:
+            if page > 0 and st.button("⬅️ Più recenti", key=f"note_prev_{selected_table}"):
+                st.session_state[page_key] = page - 1
+                st.rerun()
+        with page_col2:
+            if has_more and st.button("Meno recenti ➡️", key=f"note_next_{selected_table}"):
+                st.session_state[page_key] = page + 1
+                st.rerun()
+        with page_col3:
+            st.caption(f"Pagina {page + 1}")
+
+# Warehouse queries of this rerun (admins only)
+if is_admin():
+    st.caption(f"🔎 Query Snowflake in questo rerun: {session.query_count} / {session.max_queries}")
 
 # Footer with Unipol branding
 st.markdown("<br><br>", unsafe_allow_html=True)